@@ -0,0 +1,119 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DownloadManifest:
+    """
+    下载清单(SQLite)，记录每个下载文件的状态、行数、大小、哈希和下载时间，
+    用于断点续传：只重新下载缺失、过期或者损坏的文件
+    """
+
+    def __init__(self, db_path):
+        self.root = Path(db_path).parent
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS manifest (
+                    path TEXT PRIMARY KEY,
+                    api_name TEXT,
+                    symbol TEXT,
+                    status TEXT,
+                    rows INTEGER,
+                    size INTEGER,
+                    sha256 TEXT,
+                    fetched_at REAL,
+                    error TEXT
+                )""")
+            self.conn.commit()
+
+    def _key(self, path):
+        return os.path.relpath(path, self.root)
+
+    def get(self, path):
+        with self.lock:
+            cur = self.conn.execute(
+                "SELECT status, rows, size, sha256, fetched_at FROM manifest WHERE path=?",
+                (self._key(path),),
+            )
+            row = cur.fetchone()
+        if row is None:
+            return None
+        return dict(zip(["status", "rows", "size", "sha256", "fetched_at"], row))
+
+    def record(self, path, api_name, symbol, rows, status="done", fetched_at=None):
+        size = os.path.getsize(path)
+        sha256 = file_sha256(path)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+                (
+                    self._key(path),
+                    api_name,
+                    symbol,
+                    status,
+                    rows,
+                    size,
+                    sha256,
+                    time.time() if fetched_at is None else fetched_at,
+                ),
+            )
+            self.conn.commit()
+
+    def _adopt(self, path):
+        """
+        清单建立之前已经下载的非空文件直接加入清单，不用重新下载
+        下载时间取文件的修改时间，过期判断和正常下载的文件一样
+        """
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+        self.record(path, None, None, None, fetched_at=os.path.getmtime(path))
+        return self.get(path)
+
+    def record_failed(self, path, api_name, symbol, error, status="failed"):
+        """下载失败(failed)或者数据校验不通过(invalid)，不保存文件只记录原因"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO manifest (path, api_name, symbol, status, fetched_at, error) VALUES (?, ?, ?, ?, ?, ?)",
+                (self._key(path), api_name, symbol, status, time.time(), str(error)),
+            )
+            self.conn.commit()
+
+    def is_invalid(self, path):
+        rec = self.get(path)
+        return rec is not None and rec["status"] == "invalid"
+
+    def is_complete(self, path, stale_after=None, verify_hash=False):
+        """
+        文件已完整下载：有完成记录、文件大小一致、未过期(stale_after秒)，
+        verify_hash=True 时还要校验哈希；没有记录的已有文件先加入清单
+        """
+        rec = self.get(path)
+        if rec is None:
+            rec = self._adopt(path)
+        if rec is None or rec["status"] != "done":
+            return False
+        if not os.path.exists(path) or os.path.getsize(path) != rec["size"]:
+            return False
+        if stale_after is not None and time.time() - rec["fetched_at"] > stale_after:
+            return False
+        if verify_hash and file_sha256(path) != rec["sha256"]:
+            return False
+        return True
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
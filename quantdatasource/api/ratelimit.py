@@ -0,0 +1,48 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """令牌桶限流器(线程安全)，rate为每分钟允许的访问次数"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate / 60.0
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.last) * self.rate
+            )
+            self.last = now
+            # 先预占令牌，令牌不足时计算需要等待的时间，等待期间不占用锁
+            self.tokens -= 1
+            wait_t = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait_t > 0:
+            time.sleep(wait_t)
+
+
+class RateLimiter:
+    """按接口名称分别限流，未单独配置的接口使用 default 的限额"""
+
+    def __init__(self, rate_limits, capacity=1):
+        self.rate_limits = rate_limits
+        self.capacity = capacity
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, api_name):
+        with self.lock:
+            bucket = self.buckets.get(api_name)
+            if bucket is None:
+                rate = self.rate_limits.get(api_name, self.rate_limits["default"])
+                bucket = TokenBucket(rate, self.capacity)
+                self.buckets[api_name] = bucket
+            return bucket
+
+    def acquire(self, api_name):
+        self.get_bucket(api_name).acquire()
@@ -0,0 +1,129 @@
+"""
+原始数据文件格式
+默认 parquet：列式存储，保留字段类型，读取时无需解析文本，可以只读取需要的列
+csv：兼容旧的下载目录
+"""
+
+from ast import literal_eval
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from .utils import atomic_write
+
+raw_suffixes = {"parquet": ".parquet", "csv": ".csv"}
+
+
+def raw_suffix(raw_format):
+    return raw_suffixes[raw_format]
+
+
+def is_raw_file(path):
+    path = Path(path)
+    return path.is_file() and path.suffix in raw_suffixes.values()
+
+
+def list_raw_files(directory):
+    """
+    目录下的原始数据文件，同名的文件只返回一个，parquet 优先
+    旧的 csv 下载之后又以 parquet 重新下载时不会重复读取
+    """
+    suffixes = list(raw_suffixes.values())
+    files = {}
+    for f in Path(directory).iterdir():
+        if not is_raw_file(f):
+            continue
+        old = files.get(f.stem)
+        if old is None or suffixes.index(f.suffix) < suffixes.index(old.suffix):
+            files[f.stem] = f
+    return list(files.values())
+
+
+def find_raw(path):
+    """path 不含后缀，按 parquet、csv 的顺序返回已存在的文件，都不存在时返回 parquet 路径"""
+    for suffix in raw_suffixes.values():
+        p = Path(f"{path}{suffix}")
+        if p.exists():
+            return p
+    return Path(f"{path}{raw_suffixes['parquet']}")
+
+
+def existing_raw(path):
+    """
+    path 带后缀：返回同名的已存在文件(parquet、csv 的顺序)，都不存在时返回 path
+    更换默认格式之后，旧格式下载的文件仍然视为已下载
+    """
+    path = Path(path)
+    if path.suffix in raw_suffixes.values():
+        found = find_raw(path.with_suffix(""))
+        if found.exists():
+            return found
+    return path
+
+
+def write_raw(df: pd.DataFrame, path, index=True):
+    """按文件后缀写入，先写临时文件再改名，下载中途崩溃不会留下不完整的文件"""
+    path = Path(path)
+    with atomic_write(path) as tmp:
+        if path.suffix == ".parquet":
+            # index=None 时 RangeIndex 只保存在元数据中
+            df.to_parquet(tmp, index=None if index else False)
+        else:
+            df.to_csv(tmp, index=index)
+
+
+def read_raw(path, columns=None, **csv_kwargs) -> pd.DataFrame:
+    """
+    按文件后缀读取，csv_kwargs 只对 csv 生效(parquet 自带字段类型和行索引)
+    """
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path, columns=columns)
+    df = pd.read_csv(path, **csv_kwargs)
+    if columns is not None:
+        df = df[columns]
+    return df
+
+
+def parse_list(x):
+    """列表字段在 csv 中保存为字符串，在 parquet 中为数组"""
+    if isinstance(x, str):
+        return literal_eval(x)
+    if x is None or (isinstance(x, float) and pd.isna(x)):
+        return []
+    return list(x)
+
+
+def csv_to_parquet(csv_path, parquet_path, compression="zstd", block_size=16 << 20):
+    """
+    csv 流式转换为 parquet：按 block_size 分块读取、逐块写入一个 row group，
+    内存占用与文件大小无关；row group 带 datetime 的统计信息，可以按时间范围只读取需要的部分
+    数值列固定为 float64，避免按第一块推断的类型与后面的数据不一致
+    返回写入的行数
+    """
+    with open(csv_path, "r") as f:
+        columns = f.readline().strip().split(",")
+    column_types = {c: pa.float64() for c in columns if "." in c}
+    if "datetime" in columns:
+        column_types["datetime"] = pa.timestamp("ns")
+    if "datetime_nano" in columns:
+        column_types["datetime_nano"] = pa.int64()
+    reader = pacsv.open_csv(
+        csv_path,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        convert_options=pacsv.ConvertOptions(
+            column_types=column_types,
+            null_values=["", "nan", "NaN", "#N/A"],
+            strings_can_be_null=True,
+        ),
+    )
+    rows = 0
+    with atomic_write(parquet_path) as tmp:
+        with pq.ParquetWriter(tmp, reader.schema, compression=compression) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    return rows
@@ -2,9 +2,10 @@ import json
 import logging
 import os
 import shutil
-from ast import literal_eval
+import time
 from collections import defaultdict
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
 
 import pandas as pd
@@ -13,11 +14,23 @@ from tqsdk.tools import DataDownloader
 
 from quantdatasource.api.tqsdk_utils import *
 
+from .manifest import DownloadManifest
+from .raw_format import (
+    csv_to_parquet,
+    existing_raw,
+    is_raw_file,
+    parse_list,
+    raw_suffix,
+    read_raw,
+    write_raw,
+)
 from .utils import log
 
+tick_suffixes = {"parquet": ".parquet", "zip": ".zip", "csv": ".csv"}
+
 
 class TQSDKApi:
-    def __init__(self, username, psw, output, trade_date):
+    def __init__(self, username, psw, output, trade_date, raw_format="parquet"):
         self.output = Path(output, "tqsdk")
         if isinstance(trade_date, int):
             trade_date = str(trade_date)
@@ -28,16 +41,18 @@ class TQSDKApi:
             trade_date = trade_date.strftime("%Y%m%d")
         self.trade_date = trade_date
         self.api = TqApi(auth=TqAuth(username, psw))
-        self.future_basic_path = Path(self.output, "future_basic.csv")
-        self.product_basic_path = Path(self.output, "product_basic.csv")
-        self.cont_history_path = Path(self.output, "cont_history.csv")
+        self.suffix = suffix = raw_suffix(raw_format)
+        self.future_basic_path = Path(self.output, f"future_basic{suffix}")
+        self.product_basic_path = Path(self.output, f"product_basic{suffix}")
+        self.cont_history_path = Path(self.output, f"cont_history{suffix}")
         self.cont_list_path = Path(self.output, "cont_list.json")
         self.stock_list_path = Path(self.output, f"stock_list.json")
         self.bars_current_path = Path(self.output, "klines", "current")
         self.bars_history_path = Path(self.output, "klines", "history")
         self.adjust_factors_path = Path(self.output, "adjust_factors")
-        self.adjust_factors_filepath = Path(self.output, "adjust_factors.csv")
+        self.adjust_factors_filepath = Path(self.output, f"adjust_factors{suffix}")
         self.ticks_path = Path(self.output, "ticks")
+        self.manifest = DownloadManifest(Path(output, "manifest.db"))
 
         self.bars_current_path.mkdir(parents=True, exist_ok=True)
         self.bars_history_path.mkdir(parents=True, exist_ok=True)
@@ -46,6 +61,25 @@ class TQSDKApi:
 
     def close(self):
         self.api.close()
+        self.manifest.close()
+
+    def _save(self, df, path, api_name, symbol="", index=True):
+        write_raw(df, path, index=index)
+        self.manifest.record(path, api_name, symbol, len(df))
+
+    def _save_klines(self, klines, path, symbol):
+        """K线写入前校验，不合法的不写入(删除原文件)，在下载清单中记为 invalid，以后不用再读取文件检查"""
+        error = validate_klines(klines)
+        if error is not None:
+            if path.exists():
+                os.remove(path)
+            self.manifest.record_failed(
+                path, "get_kline_serial", symbol, error, status="invalid"
+            )
+            logging.error(f"  删除 {path.name} : {error}")
+            return False
+        self._save(klines, path, "get_kline_serial", symbol, index=False)
+        return True
 
     @log
     def full_download_future_basic(self):
@@ -65,7 +99,7 @@ class TQSDKApi:
             or q.startswith("GFEX")
         ]
         df = self.api.query_symbol_info(quotes)
-        df.to_csv(self.future_basic_path, index=False)
+        self._save(df, self.future_basic_path, "query_symbol_info", index=False)
         logging.info("  期货基本资料下载完成")
 
         # 生成product_id -> exchange id 的映射
@@ -107,7 +141,7 @@ class TQSDKApi:
             ],
             axis=1,
         )
-        df.to_csv(self.product_basic_path)
+        self._save(df, self.product_basic_path, "get_quote_list")
 
     @log
     def full_download_future_cont_history(self, symbols=None):
@@ -116,7 +150,7 @@ class TQSDKApi:
             with open(self.cont_list_path, "r") as f:
                 symbols = json.load(f)
         klines = self.api.query_his_cont_quotes(symbols, n=2200)
-        klines.to_csv(self.cont_history_path, index=False)
+        self._save(klines, self.cont_history_path, "query_his_cont_quotes", index=False)
 
     @log
     def full_download_future_cont_list(self):
@@ -149,8 +183,8 @@ class TQSDKApi:
         self, symbol, interval, data_length=8000, force_replace=False, is_history=True
     ):
         path = self.bars_history_path if is_history else self.bars_current_path
-        pathname = Path(path, f"{symbol}_{interval}.csv")
-        if not force_replace and os.path.exists(pathname):
+        pathname = Path(path, f"{symbol}_{interval}{self.suffix}")
+        if not force_replace and self.manifest.is_complete(existing_raw(pathname)):
             # logging.info(f"{pathname} already exists, skip download.")
             return
 
@@ -158,48 +192,151 @@ class TQSDKApi:
         klines = self.api.get_kline_serial(
             symbol, data_length=data_length, duration_seconds=interval
         )
-        klines.to_csv(pathname, index=False)
+        self._save_klines(klines, pathname, symbol)
         logging.info(f"---------{symbol} {interval} over -----------")
 
+    def _subscribe_klines(self, symbol, interval, data_length):
+        """
+        在 TqApi 的事件循环中订阅K线，此时 get_kline_serial 不会阻塞等待数据，
+        返回的 task 在下一次 wait_update 时完成
+        """
+
+        async def subscribe():
+            return self.api.get_kline_serial(
+                symbol, data_length=data_length, duration_seconds=interval
+            )
+
+        return self.api.create_task(subscribe())
+
+    def _klines_ready(self, task):
+        # 订阅完成并且K线序列的数据已全部收到
+        return task.done() and self.api.is_serial_ready(task.result())
+
+    def _tail_length(self, pathname, interval, data_length):
+        """
+        已有完整的K线文件时只下载缺少的部分，返回需要下载的K线数量，需要全量下载时返回 None
+        按最后一根K线到现在的时间估算(期货每天的交易时间不超过一半)，多下载的部分在合并时去重
+        """
+        if not self.manifest.is_complete(pathname):
+            return None
+        last_dt = read_raw(pathname, columns=["datetime"])["datetime"].max()
+        if pd.isna(last_dt):
+            return None
+        elapsed = time.time() - last_dt / 1e9
+        length = int(max(elapsed, 0) * 0.5 / interval) + 10
+        return length if length < data_length else None
+
+    @staticmethod
+    def _append_bars(old, klines, data_length):
+        """
+        新下载的K线按 datetime 去重追加到已有K线之后，只保留最近 data_length 根
+        新K线与已有K线没有重叠(中间可能缺数据)时返回 None
+        """
+        old = old.loc[old["id"] >= 0]
+        new = klines.loc[klines["id"] >= 0]
+        if (
+            not old.empty
+            and not new.empty
+            and new["datetime"].iloc[0] > old["datetime"].iloc[-1]
+        ):
+            return None
+        df = pd.concat([old, new], ignore_index=True)
+        df = df.drop_duplicates(subset=["datetime"], keep="last")
+        return df.tail(data_length).reset_index(drop=True)
+
+    def download_bars_concurrently(self, tasks, max_downloading=32, timeout=60):
+        """
+        tasks 为 (symbol, interval, data_length, pathname, tail_length) 的迭代器，
+        tail_length 为 None 时全量下载 data_length 根K线替换原文件，
+        否则只下载最近 tail_length 根追加到原文件，没有重叠时改为全量下载
+        同时保持 max_downloading 个 get_kline_serial 订阅，由同一个 wait_update 循环驱动，
+        每个序列就绪后马上保存；超过 timeout 秒未就绪的记为下载失败
+        """
+
+        def subscribe(symbol, interval, data_length, pathname, tail_length):
+            task = self._subscribe_klines(symbol, interval, tail_length or data_length)
+            return task, (symbol, interval, data_length, pathname, tail_length)
+
+        tasks = iter(tasks)
+        downloading = []
+        while True:
+            for args in islice(tasks, max_downloading - len(downloading)):
+                downloading.append((*subscribe(*args), time.monotonic()))
+            if not downloading:
+                break
+            self.api.wait_update(deadline=time.time() + 1)
+            running = []
+            for item in downloading:
+                task, args, started = item
+                symbol, interval, data_length, pathname, tail_length = args
+                if task.done() and task.exception() is not None:
+                    self.manifest.record_failed(
+                        pathname, "get_kline_serial", symbol, task.exception()
+                    )
+                    logging.error(f"  下载失败: {pathname.name} {task.exception()}")
+                elif self._klines_ready(task):
+                    klines = task.result()
+                    if tail_length is not None:
+                        klines = self._append_bars(
+                            read_raw(pathname), klines, data_length
+                        )
+                        if klines is None:
+                            logging.warning(
+                                f"  {pathname.name} 增量数据不连续，全量下载"
+                            )
+                            running.append(
+                                (
+                                    *subscribe(
+                                        symbol, interval, data_length, pathname, None
+                                    ),
+                                    time.monotonic(),
+                                )
+                            )
+                            continue
+                    if self._save_klines(klines, pathname, symbol):
+                        logging.info(f"  下载完成: {pathname.name}")
+                elif time.monotonic() - started > timeout:
+                    self.manifest.record_failed(
+                        pathname, "get_kline_serial", symbol, "timeout"
+                    )
+                    logging.error(f"  下载超时: {pathname.name}")
+                else:
+                    running.append(item)
+            downloading = running
+
     @log
-    def full_download_bars(self):
+    def full_download_bars(self, max_downloading=32, incremental=True):
         """
         全量下载主力合约K线数据，用于行情数据的补全（除了日线之外的分钟线、小时线）
+        同时订阅 max_downloading 个K线序列，max_downloading=1 时逐个下载
+        incremental=True 时当前合约只下载上次之后的K线追加到已有文件，否则清空后重新下载
         """
         # 先下载所有历史合约，再下载当前合约
         # 3H/4H 合约需要上一个合约拼接
         # 由于天勤的日线最早只能下到16年，所以日线由tushare接口下载
-        if self.bars_current_path.exists():
+        if not incremental and self.bars_current_path.exists():
             shutil.rmtree(self.bars_current_path, ignore_errors=True)
-        os.makedirs(self.bars_current_path)
+        os.makedirs(self.bars_current_path, exist_ok=True)
         quotes = self.api.query_quotes(ins_class="FUTURE", expired=True)
         valid_quotes = [q for q in quotes if q not in cannot_download_symbols]
         logging.info(
             f"  总共有{len(quotes)}只历史合约, 排除掉下载阻塞的标的，剩下{len(valid_quotes)}"
         )
 
-        for q in valid_quotes:
-            # 已经下载的不再下载
-            self.download_bars(q, 900)  # 15m
-
-        removed_ = []
-        for basepath in [self.bars_history_path]:
-            # for basepath in [self.bars_history_path, self.bars_current_path]:
-            for csv in os.listdir(basepath):
-                if not csv.endswith(".csv"):
-                    continue
-                df = pd.read_csv(os.path.join(basepath, csv))
-                if df.empty:
-                    logging.error(f"  删除 {csv} : 数据为空")
-                    removed_.append(os.path.join(basepath, csv))
-                    continue
-                df = df.loc[(df["id"] >= 0) & (df["close"] == 0)]
-                if len(df) > 0:
-                    logging.error(f"  删除 {csv} : 合法数据中收盘价为0")
-                    removed_.append(os.path.join(basepath, csv))
-                    continue
-        for csv in removed_:
-            os.remove(csv)
+        # 已经下载的和校验不通过的不再下载，历史合约只下载15m
+        history_tasks = (
+            (q, 900, 8000, Path(self.bars_history_path, f"{q}_900{self.suffix}"), None)
+            for q in valid_quotes
+        )
+        self.download_bars_concurrently(
+            (
+                t
+                for t in history_tasks
+                if not self.manifest.is_complete(existing_raw(t[3]))
+                and not self.manifest.is_invalid(t[3])
+            ),
+            max_downloading,
+        )
 
         if not self.product_basic_path.exists():
             logging.error(
@@ -207,7 +344,7 @@ class TQSDKApi:
             )
             return
 
-        df = pd.read_csv(self.product_basic_path, index_col=0)
+        df = read_raw(self.product_basic_path, index_col=0)
         all_symbols = []
         intervals = [
             (60, 1000),  # 1m
@@ -217,9 +354,7 @@ class TQSDKApi:
             (900, 8000),  # 15m
         ]
         # not_commodity_products = ['T', 'TS', 'TF', 'TL', 'IC', 'IF', 'IH', 'IM']
-        df["cont_symbols"] = df["cont_symbols"].apply(
-            lambda x: literal_eval(x) if not pd.isna(x) else []
-        )
+        df["cont_symbols"] = df["cont_symbols"].apply(parse_list)
         for row in df.itertuples():
             product_id = row.Index
             exchange = row.exchange
@@ -228,14 +363,26 @@ class TQSDKApi:
                 for sec, length in intervals:
                     all_symbols.append((symbol, product_id, exchange, sec, length))
 
+        current_tasks = []
         for symbol, product_id, exchange, sec, length in all_symbols:
-            self.download_bars(
-                f"{exchange}.{symbol}",
-                sec,
-                data_length=length,
-                force_replace=True,
-                is_history=False,
+            pathname = Path(
+                self.bars_current_path, f"{exchange}.{symbol}_{sec}{self.suffix}"
             )
+            tail_length = (
+                self._tail_length(pathname, sec, length) if incremental else None
+            )
+            current_tasks.append(
+                (f"{exchange}.{symbol}", sec, length, pathname, tail_length)
+            )
+
+        # 不再是主力的合约删除
+        pathnames = {task[3] for task in current_tasks}
+        for pathname in self.bars_current_path.iterdir():
+            if is_raw_file(pathname) and pathname not in pathnames:
+                logging.info(f"  删除 {pathname.name} : 不再是主力合约")
+                os.remove(pathname)
+
+        self.download_bars_concurrently(current_tasks, max_downloading)
 
     @log
     def cal_cont_future_adjust_factors(self, force_replace=False):
@@ -246,15 +393,19 @@ class TQSDKApi:
                 f"  {self.cont_history_path}不存在，必须先调用 full_download_future_cont_list"
             )
             return
-        cont_history = pd.read_csv(self.cont_history_path)
+        cont_history = read_raw(self.cont_history_path)
         cont_history["date"] = pd.to_datetime(cont_history["date"], utc=True)
         # TODO: 下载的cont_history有错误，和实际ticks数据对不上，这里只是将发现的错误修正，没时间全部查看一遍
         # TODO：2018-06-19 ag 白银也有问题
         correct_cont_history(cont_history)
         # TODO: connect to database for fetching daily bars in get_close_price_diff
         for symbol in cont_history.columns[1:]:
-            adjust_factors_file = Path(self.adjust_factors_path, f"{symbol}.csv")
-            if not force_replace and adjust_factors_file.exists():
+            adjust_factors_file = Path(
+                self.adjust_factors_path, f"{symbol}{self.suffix}"
+            )
+            if not force_replace and self.manifest.is_complete(
+                existing_raw(adjust_factors_file)
+            ):
                 continue
             print(symbol)
             df = cont_history[["date", symbol]]
@@ -268,88 +419,127 @@ class TQSDKApi:
             )
             df["factor"] = df["diff"].cumsum()
             # print(df)
-            df.to_csv(adjust_factors_file)
+            self._save(df, adjust_factors_file, "adjust_factors", symbol)
 
         # 第三步合并所有合约的价差到一个文件中
         df = pd.concat(
             [
-                pd.read_csv(
-                    Path(self.adjust_factors_path, f"{symbol}.csv"), index_col=0
+                read_raw(
+                    existing_raw(
+                        Path(self.adjust_factors_path, f"{symbol}{self.suffix}")
+                    ),
+                    index_col=0,
                 )
                 for symbol in cont_history.columns[1:]
             ],
             ignore_index=True,
         )
-        df.to_csv(self.adjust_factors_filepath, index=True)
+        self._save(df, self.adjust_factors_filepath, "adjust_factors")
 
-    @log
-    def full_download_ticks(
-        self, symbols_or_file, start_month, end_month, zip, symbol_type="future"
+    def _tick_month_tasks(
+        self, symbols, start_month, end_month, tick_format, symbol_type
     ):
-        if not symbols_or_file:
-            return
-        if isinstance(symbols_or_file, str):
-            with open(symbols_or_file, "r") as f:
-                symbols = json.load(f)
-        else:
-            symbols = symbols_or_file
-
-        all_tick_months = pd.date_range(start_month, end_month, freq="M")
+        """按合约、月份生成需要下载的tick任务"""
+        all_tick_months = pd.date_range(
+            start_month, end_month, freq=pd.offsets.MonthEnd()
+        )
         for symbol in symbols:
             folder_name = Path(self.ticks_path, symbol)
-            if os.path.exists(folder_name + ".zip"):
+            if Path(f"{folder_name}.zip").exists():
                 # unzip_file(folder_name+'.zip', dir = args.folder)
                 continue
-            if not folder_name.is_dir():
-                folder_name.mkdir(exist_ok=True)
-            curp = os.getcwd()
-            os.chdir(folder_name)
-            download_tasks = []
-            download_files = []
+            folder_name.mkdir(exist_ok=True)
             for _yearmonth in all_tick_months:
                 year, month = _yearmonth.year, _yearmonth.month
                 if symbol_type == "astock" and not stock_is_on_list(
                     symbol, year, month, self.output
                 ):
                     continue
-                _year, _month = next_month(year, month)
                 task_name = f"{symbol}_{year}_{month:02d}"
-                output_filename = f"{task_name}.csv"
-                output_zip_filename = f"{task_name}.zip"
-                download_files.append((output_filename, output_zip_filename))
-                if not os.path.exists(output_filename) and not os.path.exists(
-                    output_zip_filename
+                csv_path = Path(folder_name, f"{task_name}.csv")
+                final_path = Path(
+                    folder_name, f"{task_name}{tick_suffixes[tick_format]}"
+                )
+                # 任一格式已下载完成的月份不再下载，包括旧的 zip、csv 文件
+                if any(
+                    self.manifest.is_complete(Path(folder_name, f"{task_name}{suffix}"))
+                    for suffix in tick_suffixes.values()
                 ):
-                    downloader = DataDownloader(
-                        self.api,
-                        symbol_list=[symbol],
-                        dur_sec=0,
-                        start_dt=datetime(year, month, 1, 0, 0, 0),
-                        end_dt=datetime(_year, _month, 1, 0, 0, 0),
-                        csv_file_name=output_filename,
-                    )
-                    download_tasks.append(
-                        (
-                            (symbol, year, month, output_filename),
-                            downloader,
-                        )
-                    )
-                    logging.info(f"开始下载: {output_filename}")
-
-            while not all([v[1].is_finished() for v in download_tasks]):
-                self.api.wait_update()
-
-            for output_filename, output_zip_filename in download_files:
-                if is_file_empty(output_filename):
-                    os.remove(output_filename)
-                    logging.error(f"下载数据为空：移除{output_filename}")
-                if is_file_empty(output_zip_filename):
-                    os.remove(output_zip_filename)
-                    logging.error(f"下载数据为空：移除{output_zip_filename}")
-                if zip:
-                    if os.path.exists(output_filename) and not os.path.exists(
-                        output_zip_filename
-                    ):
-                        zip_file(output_filename, output_zip_filename)
-                        os.remove(output_filename)
-            os.chdir(curp)
+                    continue
+                yield symbol, year, month, csv_path, final_path
+
+    def _finish_tick_month(self, symbol, csv_path, final_path):
+        """一个月的tick下载完成后马上转换为最终格式，并记录到下载清单"""
+        if is_file_empty(csv_path):
+            os.remove(csv_path)
+            logging.error(f"下载数据为空：移除{csv_path.name}")
+        rows = None
+        if final_path != csv_path and csv_path.exists():
+            if final_path.suffix == ".parquet":
+                rows = csv_to_parquet(csv_path, final_path)
+            else:
+                zip_file(csv_path, final_path)
+            os.remove(csv_path)
+        if final_path.exists():
+            self.manifest.record(final_path, "ticks", symbol, rows)
+            logging.info(f"下载完成: {final_path.name}")
+
+    @log
+    def full_download_ticks(
+        self,
+        symbols_or_file,
+        start_month,
+        end_month,
+        tick_format="parquet",
+        symbol_type="future",
+        max_downloading=8,
+    ):
+        """
+        下载tick数据，每个合约每个月一个文件
+        所有合约的月份任务一起调度，最多同时运行 max_downloading 个 DataDownloader
+        tick_format:
+            parquet: 每个月下载完成后流式转换为 zstd 压缩的 parquet，可以按时间范围读取
+            zip: 兼容旧的 csv+zip 格式
+            csv: 不压缩
+            兼容旧的 zip 参数：True 为 zip，False 为 csv
+        """
+        if isinstance(tick_format, bool):
+            tick_format = "zip" if tick_format else "csv"
+        if tick_format not in tick_suffixes:
+            raise ValueError(f"不支持的tick格式 {tick_format}")
+        if not symbols_or_file:
+            return
+        if isinstance(symbols_or_file, str):
+            with open(symbols_or_file, "r") as f:
+                symbols = json.load(f)
+        else:
+            symbols = symbols_or_file
+
+        tasks = self._tick_month_tasks(
+            symbols, start_month, end_month, tick_format, symbol_type
+        )
+        downloading = []
+        while True:
+            for task in islice(tasks, max_downloading - len(downloading)):
+                symbol, year, month, csv_path, final_path = task
+                _year, _month = next_month(year, month)
+                downloader = DataDownloader(
+                    self.api,
+                    symbol_list=[symbol],
+                    dur_sec=0,
+                    start_dt=datetime(year, month, 1, 0, 0, 0),
+                    end_dt=datetime(_year, _month, 1, 0, 0, 0),
+                    csv_file_name=str(csv_path),
+                )
+                downloading.append((downloader, symbol, csv_path, final_path))
+                logging.info(f"开始下载: {csv_path.name}")
+            if not downloading:
+                break
+            self.api.wait_update()
+            running = []
+            for item in downloading:
+                if item[0].is_finished():
+                    self._finish_tick_month(*item[1:])
+                else:
+                    running.append(item)
+            downloading = running
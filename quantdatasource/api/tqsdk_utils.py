@@ -192,23 +192,40 @@ def is_file_empty(filename):
     return False
 
 
+def validate_klines(df):
+    """下载的K线写入前检查，返回不合法的原因，合法时返回 None"""
+    df = df.loc[df["id"] >= 0]
+    if df.empty:
+        return "数据为空"
+    if (df["close"] == 0).any():
+        return "合法数据中收盘价为0"
+    return None
+
+
 def zip_file(filename, zipfilename):
     zip = zipfile.ZipFile(zipfilename, "w", zipfile.ZIP_DEFLATED)
-    zip.write(filename)
+    zip.write(filename, arcname=os.path.basename(filename))
     zip.close()
 
 
 @cache
 def _get_stock_basic_df(output):
-    from .tushare import TushareApi
+    from .raw_format import find_raw, read_raw
 
-    basic_stock_path = Path(output).parent.joinpath(TushareApi.dir, "stock_basic.csv")
+    basic_stock_path = find_raw(Path(output).parent.joinpath("tushare", "stock_basic"))
     if not basic_stock_path.exists():
         logging.error(
             f"{basic_stock_path}不存在，必须先调用 TushareApi.full_download_stock_basic"
         )
         return None
-    df = pd.read_csv(basic_stock_path, index_col=0)
+    df = read_raw(
+        basic_stock_path, dtype={"list_date": str, "delist_date": str}, index_col=0
+    )
+    df["list_date"] = pd.to_datetime(df["list_date"], format="%Y%m%d")
+    # 未退市的股票退市日期为空
+    df["delist_date"] = pd.to_datetime(df["delist_date"], format="%Y%m%d").fillna(
+        pd.Timestamp.max
+    )
     return df
 
 
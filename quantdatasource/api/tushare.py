@@ -1,21 +1,81 @@
 import logging
 import os
 import shutil
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
 from datetime import datetime, timedelta
 from pathlib import Path
-from time import sleep, time
 
 import pandas as pd
 import tushare as ts
 from quantcalendar import CalendarAstock, pydt_from_sec_list, pydt_from_second
 
+from .manifest import DownloadManifest
+from .ratelimit import RateLimiter
+from .raw_format import existing_raw, raw_suffix, read_raw, write_raw
 from .utils import log
 
+# 各接口每分钟最多访问次数，可在配置文件 tushare_rate_limits 中按接口名覆盖
+default_rate_limits = {
+    "default": 500,
+    "cb_share": 400,
+    "cb_call": 400,
+    "ths_member": 100,
+}
+
+# 各接口单次最多返回的行数，超过需要按 offset 分页拉取
+page_limits = {
+    "daily": 6000,
+    "daily_basic": 6000,
+    "moneyflow": 6000,
+    "ths_daily": 3000,
+    "cb_daily": 2000,
+}
+
+cb_daily_fields = [
+    "ts_code",
+    "trade_date",
+    "pre_close",
+    "open",
+    "high",
+    "low",
+    "close",
+    "change",
+    "pct_chg",
+    "vol",
+    "amount",
+    "bond_value",
+    "bond_over_rate",
+    "cb_value",
+    "cb_over_rate",
+]
+
+# 按标的下载的单个任务，index 对应是否写入行索引
+DownloadTask = namedtuple(
+    "DownloadTask", ["api_name", "kwargs", "path", "desc", "index"], defaults=[True]
+)
+
 
 class TushareApi:
-    def __init__(self, token, output, trade_date) -> None:
+    def __init__(
+        self,
+        token,
+        output,
+        trade_date,
+        rate_limits=None,
+        workers=4,
+        stale_after=None,
+        raw_format="parquet",
+    ) -> None:
         self.api = ts.pro_api(token)
+        self.rate_limiter = RateLimiter({**default_rate_limits, **(rate_limits or {})})
+        self.workers = workers
+        # 下载清单中超过 stale_after 秒的文件视为过期，全量下载时重新下载
+        self.stale_after = stale_after
         self.output = Path(output, "tushare")
+        self.manifest = DownloadManifest(Path(output, "manifest.db"))
+        self.suffix = suffix = raw_suffix(raw_format)
         if isinstance(trade_date, int):
             trade_date = str(trade_date)
         if isinstance(trade_date, str):
@@ -24,9 +84,11 @@ class TushareApi:
             self.dt = trade_date
             trade_date = trade_date.strftime("%Y%m%d")
         self.trade_date = trade_date
-        self.basic_stock_path = Path(self.output, "stock_basic.csv")
-        self.basic_cb_path = Path(self.output, "cb_basic.csv")
-        self.ths_index_a_concepts_path = Path(self.output, "ths_index_a_concepts.csv")
+        self.basic_stock_path = Path(self.output, f"stock_basic{suffix}")
+        self.basic_cb_path = Path(self.output, f"cb_basic{suffix}")
+        self.ths_index_a_concepts_path = Path(
+            self.output, f"ths_index_a_concepts{suffix}"
+        )
         self.finance_income_path = Path(self.output, "income")
         self.finance_balancesheet_path = Path(self.output, "balancesheet")
         self.finance_cashflow_path = Path(self.output, "cashflow")
@@ -39,32 +101,36 @@ class TushareApi:
         )
         self.ths_daily_bars_path = Path(self.output, "ths_concepts")
         self.ths_daily_bars_addition_path = Path(
-            self.output, "ths_concepts", "additions", f"{trade_date}.csv"
+            self.output, "ths_concepts", "additions", f"{trade_date}{suffix}"
         )
         self.ths_concepts_members_path = Path(self.output, "ths_concepts_members")
-        self.daily_bars_addition_path = Path(self.output, "daily", f"{trade_date}.csv")
+        self.daily_bars_addition_path = Path(
+            self.output, "daily", f"{trade_date}{suffix}"
+        )
         self.daily_basic_addition_path = Path(
-            self.output, "daily_basic", f"{trade_date}.csv"
+            self.output, "daily_basic", f"{trade_date}{suffix}"
         )
         self.moneyflow_addition_path = Path(
-            self.output, "moneyflow", f"{trade_date}.csv"
+            self.output, "moneyflow", f"{trade_date}{suffix}"
+        )
+        self.lhb_addition_path = Path(self.output, "lhb", f"{trade_date}{suffix}")
+        self.lhb_inst_addition_path = Path(
+            self.output, "lhb_inst", f"{trade_date}{suffix}"
         )
-        self.lhb_addition_path = Path(self.output, "lhb", f"{trade_date}.csv")
-        self.lhb_inst_addition_path = Path(self.output, "lhb_inst", f"{trade_date}.csv")
         self.cb_daily_bars_path = Path(self.output, "cb", "daily")
         self.cb_daily_bars_addition_path = Path(
-            self.cb_daily_bars_path, "additions", f"{trade_date}.csv"
+            self.cb_daily_bars_path, "additions", f"{trade_date}{suffix}"
         )
         self.cb_share_path = Path(self.output, "cb", "share")
         self.cb_call_path = Path(self.output, "cb", "call")
         self.index_daily_addition_path = Path(
-            self.output, "index", "daily", f"{trade_date}.csv"
+            self.output, "index", "daily", f"{trade_date}{suffix}"
         )
         self.index_week_addition_path = Path(
-            self.output, "index", "week", f"{trade_date}.csv"
+            self.output, "index", "week", f"{trade_date}{suffix}"
         )
         self.index_month_addition_path = Path(
-            self.output, "index", "month", f"{trade_date}.csv"
+            self.output, "index", "month", f"{trade_date}{suffix}"
         )
 
         self.daily_basic_addition_path.parent.mkdir(parents=True, exist_ok=True)
@@ -84,11 +150,80 @@ class TushareApi:
         self.lhb_addition_path.parent.mkdir(parents=True, exist_ok=True)
         self.lhb_inst_addition_path.parent.mkdir(parents=True, exist_ok=True)
 
+    def close(self):
+        self.manifest.close()
+
+    def _query_page(self, api_name, **kwargs):
+        # 所有接口调用都经过限流，按接口的每分钟限额匀速访问
+        self.rate_limiter.acquire(api_name)
+        return getattr(self.api, api_name)(**kwargs)
+
+    def _iter_pages(self, api_name, limit, **kwargs):
+        """按 offset 分页拉取，直到返回行数不足一页"""
+        offset = 0
+        while True:
+            page = self._query_page(api_name, limit=limit, offset=offset, **kwargs)
+            yield page
+            if len(page) < limit:
+                break
+            offset += limit
+
+    def _query(self, api_name, **kwargs):
+        limit = page_limits.get(api_name)
+        if limit is None:
+            return self._query_page(api_name, **kwargs)
+        pages = list(self._iter_pages(api_name, limit, **kwargs))
+        if len(pages) == 1:
+            return pages[0]
+        logging.info(f"  {api_name} {kwargs.get('ts_code', '')} 分{len(pages)}页拉取")
+        return pd.concat(pages, ignore_index=True)
+
+    def _save(self, df, path, api_name, symbol="", index=True):
+        write_raw(df, path, index=index)
+        self.manifest.record(path, api_name, symbol, len(df))
+
+    def _is_downloaded(self, path):
+        return self.manifest.is_complete(existing_raw(path), self.stale_after)
+
+    def _download_task(self, task: DownloadTask):
+        symbol = task.kwargs.get("ts_code", "")
+        try:
+            df = self._query(task.api_name, **task.kwargs)
+        except Exception as e:
+            self.manifest.record_failed(task.path, task.api_name, symbol, e)
+            raise
+        self._save(df, task.path, task.api_name, symbol, index=task.index)
+        if task.desc:
+            logging.info(f"  {task.desc}下载完成")
+
+    def _run_download_tasks(self, tasks):
+        """
+        并发执行下载任务，每个接口一个线程池，各自按接口限额访问，互不阻塞
+        """
+        grouped = defaultdict(list)
+        for task in tasks:
+            grouped[task.api_name].append(task)
+        futures = {}
+        with ExitStack() as stack:
+            for api_name, _tasks in grouped.items():
+                executor = stack.enter_context(
+                    ThreadPoolExecutor(self.workers, thread_name_prefix=api_name)
+                )
+                for task in _tasks:
+                    futures[executor.submit(self._download_task, task)] = task
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f"  {task.api_name} {task.path} 下载失败", exc_info=e)
+
     @log
     def full_download_stock_basic(self):
         """全量下载证券基本信息"""
         dfs = [
-            self.api.stock_basic(
+            self._query(
+                "stock_basic",
                 list_status="L",
                 fields=[
                     "ts_code",
@@ -108,7 +243,8 @@ class TushareApi:
                     "is_hs",
                 ],
             ),
-            self.api.stock_basic(
+            self._query(
+                "stock_basic",
                 list_status="D",
                 fields=[
                     "ts_code",
@@ -130,21 +266,21 @@ class TushareApi:
             ),
         ]
         df = pd.concat(dfs)
-        df.to_csv(self.basic_stock_path)
+        self._save(df, self.basic_stock_path, "stock_basic")
 
     @log
     def full_download_cb_basic(self):
         """全量下载可转债基本信息"""
-        df = self.api.cb_basic()
-        df.to_csv(self.basic_cb_path)
+        df = self._query("cb_basic")
+        self._save(df, self.basic_cb_path, "cb_basic")
 
     @log
     def full_download_ths_index(self):
         """全量下载同花顺概念板块列表"""
-        df = self.api.ths_index(
-            exchange="A", type="N", fields="ts_code,name,count,list_date"
+        df = self._query(
+            "ths_index", exchange="A", type="N", fields="ts_code,name,count,list_date"
         )
-        df.to_csv(self.ths_index_a_concepts_path)
+        self._save(df, self.ths_index_a_concepts_path, "ths_index")
 
     @log
     def full_download_finance_data(self, force_replace=False):
@@ -154,60 +290,53 @@ class TushareApi:
                 f"{self.basic_stock_path}不存在，必须先调用 full_download_stock_basic"
             )
             return
-        df = pd.read_csv(self.basic_stock_path, index_col=0)
-        for row in df.itertuples():
-            t = time()
-            symbol = row.ts_code
-            path = Path(self.finance_income_path, f"{symbol}.csv")
-            if not force_replace and path.exists():
-                continue
-            _df = self.api.income(ts_code=symbol)
-            _df.to_csv(path)
-            logging.info(f"  {symbol} 利润表下载完成")
-            eclipse = time() - t
-            wait_t = 0.13 - eclipse
-            if wait_t > 0:
-                sleep(wait_t)
-        for row in df.itertuples():
-            t = time()
-            symbol = row.ts_code
-            path = Path(self.finance_balancesheet_path, f"{symbol}.csv")
-            if not force_replace and path.exists():
-                continue
-            _df = self.api.balancesheet(ts_code=symbol)
-            _df.to_csv(path)
-            logging.info(f"  {symbol} 资产负债表下载完成")
-            eclipse = time() - t
-            wait_t = 0.13 - eclipse
-            if wait_t > 0:
-                sleep(wait_t)
-        for row in df.itertuples():
-            t = time()
-            symbol = row.ts_code
-            path = Path(self.finance_cashflow_path, f"{symbol}.csv")
-            if not force_replace and path.exists():
-                continue
-            _df = self.api.cashflow(ts_code=symbol)
-            _df.to_csv(path)
-            logging.info(f"  {symbol} 现金流量表下载完成")
-            eclipse = time() - t
-            wait_t = 0.13 - eclipse
-            if wait_t > 0:
-                sleep(wait_t)
+        df = read_raw(self.basic_stock_path, index_col=0)
+        # 三张报表同时下载，各自按接口限额访问
+        tasks = []
+        for api_name, finance_path, name in [
+            ("income", self.finance_income_path, "利润表"),
+            ("balancesheet", self.finance_balancesheet_path, "资产负债表"),
+            ("cashflow", self.finance_cashflow_path, "现金流量表"),
+        ]:
+            for row in df.itertuples():
+                symbol = row.ts_code
+                path = Path(finance_path, f"{symbol}{self.suffix}")
+                if not force_replace and self._is_downloaded(path):
+                    continue
+                tasks.append(
+                    DownloadTask(
+                        api_name, {"ts_code": symbol}, path, f"{symbol} {name}"
+                    )
+                )
+        self._run_download_tasks(tasks)
 
     @log
     def addition_download_finance_data(self):
         trade_yesterday = (self.dt - timedelta(days=1)).strftime("%Y%m%d")
         # 财务数据(包括昨天的，可能昨天下载的数据，还没有更新好)
         for tradedt in [self.trade_date, trade_yesterday]:
-            _df = self.api.income_vip(ann_date=tradedt)
-            _df.to_csv(Path(self.finance_income_addition_path, f"{tradedt}.csv"))
+            _df = self._query("income_vip", ann_date=tradedt)
+            self._save(
+                _df,
+                Path(self.finance_income_addition_path, f"{tradedt}{self.suffix}"),
+                "income_vip",
+            )
             logging.info(f"tushare {tradedt} 利润表下载完成")
-            _df = self.api.balancesheet_vip(ann_date=tradedt)
-            _df.to_csv(Path(self.finance_balancesheet_addition_path, f"{tradedt}.csv"))
+            _df = self._query("balancesheet_vip", ann_date=tradedt)
+            self._save(
+                _df,
+                Path(
+                    self.finance_balancesheet_addition_path, f"{tradedt}{self.suffix}"
+                ),
+                "balancesheet_vip",
+            )
             logging.info(f"tushare {tradedt} 资产负债表下载完成")
-            _df = self.api.cashflow_vip(ann_date=tradedt)
-            _df.to_csv(Path(self.finance_cashflow_addition_path, f"{tradedt}.csv"))
+            _df = self._query("cashflow_vip", ann_date=tradedt)
+            self._save(
+                _df,
+                Path(self.finance_cashflow_addition_path, f"{tradedt}{self.suffix}"),
+                "cashflow_vip",
+            )
             logging.info(f"tushare {tradedt} 现金流量表下载完成")
 
     @log
@@ -218,30 +347,21 @@ class TushareApi:
                 f"{self.ths_index_a_concepts_path}不存在，必须先调用 full_download_ths_index"
             )
             return
-        df = pd.read_csv(self.ths_index_a_concepts_path, index_col=0)
+        df = read_raw(self.ths_index_a_concepts_path, index_col=0)
+        tasks = []
         for row in df.itertuples():
-            t = time()
             symbol = row.ts_code
-            path = Path(self.ths_daily_bars_path, f"{symbol}.csv")
-            if not force_replace and path.exists():
+            path = Path(self.ths_daily_bars_path, f"{symbol}{self.suffix}")
+            if not force_replace and self._is_downloaded(path):
                 continue
-            dfs = []
-            dfs.append(self.api.ths_daily(ts_code=symbol))
-            while len(dfs[-1]) == 3000:
-                dfs.append(self.api.ths_daily(ts_code=symbol, offset=3000))
-            df = pd.concat(dfs, ignore_index=True)
-            df.to_csv(path)
-            print(f"  {symbol} 下载完成")
-            eclipse = time() - t
-            wait_t = 0.13 - eclipse
-            if wait_t > 0:
-                sleep(wait_t)
+            tasks.append(DownloadTask("ths_daily", {"ts_code": symbol}, path, symbol))
+        self._run_download_tasks(tasks)
 
     @log
     def addition_download_concepts_bars(self):
         """增量下载同花顺概念板块日线数据"""
-        df = self.api.ths_daily(trade_date=self.trade_date)
-        df.to_csv(self.ths_daily_bars_addition_path)
+        df = self._query("ths_daily", trade_date=self.trade_date)
+        self._save(df, self.ths_daily_bars_addition_path, "ths_daily")
 
     @log
     def full_download_concepts_members(self, force_replace=False):
@@ -251,20 +371,15 @@ class TushareApi:
                 f"{self.ths_index_a_concepts_path}不存在，必须先调用 full_download_ths_index"
             )
             return
-        df = pd.read_csv(self.ths_index_a_concepts_path, index_col=0)
+        df = read_raw(self.ths_index_a_concepts_path, index_col=0)
+        tasks = []
         for row in df.itertuples():
-            t = time()
             symbol = row.ts_code
-            path = Path(self.ths_concepts_members_path, f"{symbol}.csv")
-            if not force_replace and path.exists():
+            path = Path(self.ths_concepts_members_path, f"{symbol}{self.suffix}")
+            if not force_replace and self._is_downloaded(path):
                 continue
-            df = self.api.ths_member(ts_code=symbol)
-            df.to_csv(path)
-            # print(f"{symbol}下载完成")
-            eclipse = time() - t
-            wait_t = 0.61 - eclipse
-            if wait_t > 0:
-                sleep(wait_t)
+            tasks.append(DownloadTask("ths_member", {"ts_code": symbol}, path, ""))
+        self._run_download_tasks(tasks)
 
     @log
     def full_download_lhb(self):
@@ -272,28 +387,19 @@ class TushareApi:
         cal = CalendarAstock()
         for row in pydt_from_sec_list(cal.get_tradedays_gte()):
             tradeday = row.strftime("%Y%m%d")
-            t = time()
-            do_download = False
             # 龙虎榜数据从2005年开始
-            f = os.path.join(self.output, "lhb", f"{tradeday}.csv")
+            f = os.path.join(self.output, "lhb", f"{tradeday}{self.suffix}")
             self.lhb_addition_path
-            if not os.path.exists(f):
-                df = self.api.top_list(trade_date=tradeday)
-                df.to_csv(f, index=False)
-                do_download = True
+            if not self._is_downloaded(f):
+                df = self._query("top_list", trade_date=tradeday)
+                self._save(df, f, "top_list", index=False)
 
             # 龙虎榜明细数据只从2012年开始
             if tradeday > "20120101":
-                f2 = os.path.join(self.output, "lhb_inst", f"{tradeday}.csv")
-                if not os.path.exists(f2):
-                    df = self.api.top_inst(trade_date=tradeday)
-                    df.to_csv(f2, index=False)
-                    do_download = True
-            if do_download:
-                eclipse = time() - t
-                wait_t = 0.13 - eclipse
-                if wait_t > 0:
-                    sleep(wait_t)
+                f2 = os.path.join(self.output, "lhb_inst", f"{tradeday}{self.suffix}")
+                if not self._is_downloaded(f2):
+                    df = self._query("top_inst", trade_date=tradeday)
+                    self._save(df, f2, "top_inst", index=False)
 
     @log
     def full_download_cb_daily(self):
@@ -303,137 +409,108 @@ class TushareApi:
                 f"{self.basic_cb_path}不存在，必须先调用 full_download_cb_basic"
             )
             return
-        cb_basic_df = pd.read_csv(self.basic_cb_path)
+        cb_basic_df = read_raw(self.basic_cb_path)
+        tasks = []
         for row in cb_basic_df.itertuples():
-            f = Path(self.cb_daily_bars_path, f"{row.ts_code}.csv")
-            if f.exists():
-                df = pd.read_csv(f)
-                if "bond_value" not in df:
-                    f.unlink()
-                    logging.info(f"  删除{f}")
-            if not f.exists():
-                df = self.api.cb_daily(
-                    ts_code=row.ts_code,
-                    fields=[
-                        "ts_code",
-                        "trade_date",
-                        "pre_close",
-                        "open",
-                        "high",
-                        "low",
-                        "close",
-                        "change",
-                        "pct_chg",
-                        "vol",
-                        "amount",
-                        "bond_value",
-                        "bond_over_rate",
-                        "cb_value",
-                        "cb_over_rate",
-                    ],
+            f = Path(self.cb_daily_bars_path, f"{row.ts_code}{self.suffix}")
+            if not self._is_downloaded(f):
+                tasks.append(
+                    DownloadTask(
+                        "cb_daily",
+                        {"ts_code": row.ts_code, "fields": cb_daily_fields},
+                        f,
+                        "",
+                        False,
+                    )
                 )
-                if len(df) >= 2000:
-                    logging.error(f"  {row.ts_code} 超过限额，需要再拉取")
-                df.to_csv(f, index=False)
+        self._run_download_tasks(tasks)
 
     @log
     def addition_download_cb_daily(self):
         """增量下载可转债日线数据"""
-        df = self.api.cb_daily(
-            trade_date=self.trade_date,
-            fields=[
-                "ts_code",
-                "trade_date",
-                "pre_close",
-                "open",
-                "high",
-                "low",
-                "close",
-                "change",
-                "pct_chg",
-                "vol",
-                "amount",
-                "bond_value",
-                "bond_over_rate",
-                "cb_value",
-                "cb_over_rate",
-            ],
-        )
-        df.to_csv(self.cb_daily_bars_addition_path)
+        df = self._query("cb_daily", trade_date=self.trade_date, fields=cb_daily_fields)
+        self._save(df, self.cb_daily_bars_addition_path, "cb_daily")
 
-    @log
-    def full_download_cb_share_data(self, include_delist_cbs=True, force_replace=False):
-        """全量下载可转债转股数据(接口限流每分钟400次)"""
+    def _cb_download_tasks(self, api_name, cb_path, include_delist_cbs, force_replace):
         if not self.basic_cb_path.exists():
             logging.error(
                 f"{self.basic_cb_path}不存在，必须先调用 full_download_cb_basic"
             )
-            return
-        cb_basic_df = pd.read_csv(self.basic_cb_path)
+            return []
+        cb_basic_df = read_raw(self.basic_cb_path)
+        tasks = []
         for row in cb_basic_df.itertuples():
             if not include_delist_cbs and row.remain_size == 0:
                 continue
-            f = Path(self.cb_share_path, f"{row.ts_code}.csv")
-            if force_replace or not f.exists():
-                t = time()
-                df = self.api.cb_share(ts_code=row.ts_code)
-                df.to_csv(f, index=False)
-                eclipse = time() - t
-                wait_t = 0.16 - eclipse
-                if wait_t > 0:
-                    sleep(wait_t)
+            f = Path(cb_path, f"{row.ts_code}{self.suffix}")
+            if force_replace or not self._is_downloaded(f):
+                tasks.append(
+                    DownloadTask(api_name, {"ts_code": row.ts_code}, f, "", False)
+                )
+        return tasks
+
+    @log
+    def full_download_cb_share_data(self, include_delist_cbs=True, force_replace=False):
+        """全量下载可转债转股数据(接口限流每分钟400次)"""
+        self._run_download_tasks(
+            self._cb_download_tasks(
+                "cb_share", self.cb_share_path, include_delist_cbs, force_replace
+            )
+        )
 
     @log
     def full_download_cb_call_data(self, include_delist_cbs=True, force_replace=False):
         """全量下载可转债赎回数据(接口限流每分钟400次)"""
-        if not self.basic_cb_path.exists():
-            logging.error(
-                f"{self.basic_cb_path}不存在，必须先调用 full_download_cb_basic"
+        self._run_download_tasks(
+            self._cb_download_tasks(
+                "cb_call", self.cb_call_path, include_delist_cbs, force_replace
             )
-            return
-        cb_basic_df = pd.read_csv(self.basic_cb_path)
-        for row in cb_basic_df.itertuples():
-            if not include_delist_cbs and row.remain_size == 0:
-                continue
-            f = Path(self.cb_call_path, f"{row.ts_code}.csv")
-            if force_replace or not f.exists():
-                t = time()
-                df = self.api.cb_call(ts_code=row.ts_code)
-                df.to_csv(f, index=False)
-                eclipse = time() - t
-                wait_t = 0.16 - eclipse
-                if wait_t > 0:
-                    sleep(wait_t)
+        )
+
+    @log
+    def full_download_cb_share_and_call_data(
+        self, include_delist_cbs=True, force_replace=False
+    ):
+        """全量下载可转债转股和赎回数据(两个接口同时下载)"""
+        self._run_download_tasks(
+            self._cb_download_tasks(
+                "cb_share", self.cb_share_path, include_delist_cbs, force_replace
+            )
+            + self._cb_download_tasks(
+                "cb_call", self.cb_call_path, include_delist_cbs, force_replace
+            )
+        )
 
     @log
     def addition_download_daily(self):
         """增量下载个股日线"""
-        df = self.api.daily(trade_date=self.trade_date)
-        df.to_csv(self.daily_bars_addition_path)
+        df = self._query("daily", trade_date=self.trade_date)
+        self._save(df, self.daily_bars_addition_path, "daily")
 
     @log
     def addition_download_daily_basic(self):
         """增量下载每日指标"""
-        df = self.api.daily_basic(
+        df = self._query(
+            "daily_basic",
             ts_code="",
             trade_date=self.trade_date,
             fields="ts_code,trade_date,turnover_rate,pe,pe_ttm,pb,total_share,float_share,total_mv,circ_mv,limit_status",
         )
-        df.to_csv(self.daily_basic_addition_path)
+        self._save(df, self.daily_basic_addition_path, "daily_basic")
 
     @log
     def addition_download_moneyflow(self):
         """增量下载每日资金流"""
-        df = self.api.moneyflow(trade_date=self.trade_date)
-        df.to_csv(self.moneyflow_addition_path)
+        df = self._query("moneyflow", trade_date=self.trade_date)
+        self._save(df, self.moneyflow_addition_path, "moneyflow")
 
     @log
     def addition_download_lhb(self):
         """增量下载龙虎榜"""
-        df = self.api.top_list(trade_date=self.trade_date)
-        df.to_csv(self.lhb_addition_path, index=False)
-        df = self.api.top_inst(trade_date=self.trade_date)
-        df.to_csv(self.lhb_inst_addition_path, index=False)
+        df = self._query("top_list", trade_date=self.trade_date)
+        self._save(df, self.lhb_addition_path, "top_list", index=False)
+        df = self._query("top_inst", trade_date=self.trade_date)
+        self._save(df, self.lhb_inst_addition_path, "top_inst", index=False)
 
     @log
     def addition_download_index(self, index_codes):
@@ -451,9 +528,15 @@ class TushareApi:
         index_week_dfs = []
         index_month_dfs = []
         for index_code, _ in index_codes:
-            d = self.api.index_daily(ts_code=index_code, trade_date=self.trade_date)
-            w = self.api.index_weekly(ts_code=index_code, trade_date=self.trade_date)
-            m = self.api.index_monthly(ts_code=index_code, trade_date=self.trade_date)
+            d = self._query(
+                "index_daily", ts_code=index_code, trade_date=self.trade_date
+            )
+            w = self._query(
+                "index_weekly", ts_code=index_code, trade_date=self.trade_date
+            )
+            m = self._query(
+                "index_monthly", ts_code=index_code, trade_date=self.trade_date
+            )
             if d.empty:
                 logging.error(f"  大盘指数 {index_code} {self.trade_date} 日线数据为空")
             else:
@@ -474,19 +557,20 @@ class TushareApi:
                 index_month_dfs.append(m)
         if index_daily_dfs:
             index_daily_df = pd.concat(index_daily_dfs)
-            index_daily_df.to_csv(Path(self.index_daily_addition_path))
+            self._save(index_daily_df, self.index_daily_addition_path, "index_daily")
         if index_week_dfs:
             index_week_df = pd.concat(index_week_dfs)
-            index_week_df.to_csv(Path(self.index_week_addition_path))
+            self._save(index_week_df, self.index_week_addition_path, "index_weekly")
         if index_month_dfs:
             index_month_df = pd.concat(index_month_dfs)
-            index_month_df.to_csv(Path(self.index_month_addition_path))
+            self._save(index_month_df, self.index_month_addition_path, "index_monthly")
 
 
 class TushareFutureApi:
-    def __init__(self, token, output, trade_date) -> None:
+    def __init__(self, token, output, trade_date, raw_format="parquet") -> None:
         self.api = ts.pro_api(token)
         self.output = os.path.join(output, "tushare")
+        self.suffix = raw_suffix(raw_format)
         self.dt = trade_date
         trade_date = trade_date.strftime("%Y%m%d")
         self.trade_date = trade_date
@@ -496,6 +580,10 @@ class TushareFutureApi:
 
         self.future_daily_current_path.mkdir(parents=True, exist_ok=True)
         self.future_daily_history_path.mkdir(parents=True, exist_ok=True)
+        self.manifest = DownloadManifest(Path(output, "manifest.db"))
+
+    def close(self):
+        self.manifest.close()
 
     @log
     def full_download_all_future_bars(self):
@@ -548,11 +636,14 @@ class TushareFutureApi:
         history_df = df.loc[df["delist_date"] < self.dt]
         current_df = df.loc[df["delist_date"] >= self.dt]
         for row in history_df.itertuples():
-            pathname = Path(self.future_daily_history_path, f"{row.ts_code}.csv")
-            if not pathname.exists():
+            pathname = Path(
+                self.future_daily_history_path, f"{row.ts_code}{self.suffix}"
+            )
+            if not self.manifest.is_complete(existing_raw(pathname)):
                 logging.info(f"下载历史{row.ts_code}日线")
                 _df = self.api.fut_daily(ts_code=row.ts_code)
-                _df.to_csv(pathname)
+                write_raw(_df, pathname)
+                self.manifest.record(pathname, "fut_daily", row.ts_code, len(_df))
 
         if self.future_daily_current_path.exists():
             shutil.rmtree(self.future_daily_current_path)
@@ -560,4 +651,8 @@ class TushareFutureApi:
         for row in current_df.itertuples():
             logging.info(f"  下载线上{row.ts_code}日线")
             _df = self.api.fut_daily(ts_code=row.ts_code)
-            _df.to_csv(Path(self.future_daily_current_path, f"{row.ts_code}.csv"))
+            pathname = Path(
+                self.future_daily_current_path, f"{row.ts_code}{self.suffix}"
+            )
+            write_raw(_df, pathname)
+            self.manifest.record(pathname, "fut_daily", row.ts_code, len(_df))
@@ -1,5 +1,8 @@
 import functools
 import logging
+import os
+from contextlib import contextmanager
+from pathlib import Path
 
 
 def log(func):
@@ -10,3 +13,19 @@ def log(func):
         logging.info(f"{func.__name__} 结束")
 
     return wrapper
+
+
+@contextmanager
+def atomic_write(path):
+    """
+    yield 同目录下以 . 开头的临时文件，写入完成后改名为 path，出错时删除临时文件
+    读取方不会看到写了一半的文件，pyarrow 扫描数据集目录时也会忽略临时文件
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            os.remove(tmp)
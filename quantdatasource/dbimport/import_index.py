@@ -0,0 +1,42 @@
+import json
+import os
+from pathlib import Path
+
+from quantdatasource.api.utils import atomic_write
+
+
+class ImportIndex:
+    """
+    已导入文件的索引(json)，记录每个文件导入时的大小和修改时间，
+    文件没有变化时不用再读取和导入；数据库重建后需要删除索引文件
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.root = self.path.parent
+        self.files = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                self.files = json.load(f)
+
+    def _key(self, file):
+        return os.path.relpath(file, self.root)
+
+    @staticmethod
+    def _stat(file):
+        st = os.stat(file)
+        return [st.st_size, st.st_mtime_ns]
+
+    def is_imported(self, file):
+        return self.files.get(self._key(file)) == self._stat(file)
+
+    def record(self, file):
+        self.files[self._key(file)] = self._stat(file)
+
+    def save(self):
+        with atomic_write(self.path) as tmp:
+            with open(tmp, "w") as f:
+                json.dump(self.files, f)
+
+    def close(self):
+        self.save()
@@ -0,0 +1,23 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+
+def process_unordered(func, tasks, processes=None, max_pending=None):
+    """
+    多进程执行 func(*args)，tasks 为 (key, args) 的迭代器，按完成顺序 yield (key, 结果)
+    同时处理中的任务最多 max_pending 个(默认进程数的2倍)，调用方处理不过来时不再提交
+    """
+    processes = processes or os.cpu_count()
+    max_pending = max_pending or processes * 2
+    tasks = iter(tasks)
+    with ProcessPoolExecutor(processes) as executor:
+        pending = {}
+        while True:
+            for key, args in islice(tasks, max_pending - len(pending)):
+                pending[executor.submit(func, *args)] = key
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
@@ -0,0 +1,242 @@
+"""
+TDengine 写入(期货K线)
+超级表和字段见 docs/future.md，连接参数在 quantdatasource_config.yml 的 tdengine 中配置
+时间统一转为毫秒时间戳写入，没有时区的时间按 Asia/Shanghai 处理
+"""
+
+import logging
+import re
+
+import pandas as pd
+
+default_batch_size = 5000
+default_tz = "Asia/Shanghai"
+
+stables = {
+    "bars": {
+        "columns": {
+            "dt": "timestamp",
+            "open": "float",
+            "high": "float",
+            "low": "float",
+            "close": "float",
+            "volume": "int unsigned",
+            "amount": "bigint unsigned",
+            "open_interest": "int unsigned",
+        },
+        "tags": {
+            "symbol": "binary(32)",
+            "period": "binary(8)",
+            "exchange": "binary(8)",
+        },
+    },
+    "bars_daily": {
+        "columns": {
+            "dt": "timestamp",
+            "open": "float",
+            "high": "float",
+            "low": "float",
+            "close": "float",
+            "settle": "float",
+            "volume": "int unsigned",
+            "amount": "bigint unsigned",
+            "open_interest": "int unsigned",
+        },
+        "tags": {"symbol": "binary(32)", "exchange": "binary(8)"},
+    },
+    "ticks": {
+        "columns": {
+            "dt": "timestamp",
+            "last_price": "float",
+            "volume": "int unsigned",
+            "amount": "bigint unsigned",
+            "open_interest": "int unsigned",
+            "bid_price1": "float",
+            "ask_price1": "float",
+            "bid_volume1": "int unsigned",
+            "ask_volume1": "int unsigned",
+        },
+        "tags": {"symbol": "binary(32)", "exchange": "binary(8)"},
+    },
+    "tick_bars": {
+        "columns": {
+            "dt": "timestamp",
+            "open": "float",
+            "high": "float",
+            "low": "float",
+            "close": "float",
+            "volume": "int unsigned",
+            "amount": "bigint unsigned",
+            "open_interest": "int unsigned",
+        },
+        "tags": {
+            "symbol": "binary(32)",
+            "period": "binary(8)",
+            "exchange": "binary(8)",
+        },
+    },
+}
+
+_conn = None
+_database = None
+# 已创建的超级表、各超级表已存在的子表
+_created_stables = set()
+_existed_tables = {}
+
+
+def connect(
+    host="127.0.0.1",
+    port=6030,
+    user="root",
+    password="taosdata",
+    database="future",
+    conn=None,
+):
+    """
+    连接 TDengine，数据库不存在时创建(毫秒精度)
+    conn 不为空时直接使用(需要有 execute 和 query 方法)，便于替换为本地的测试实现
+    """
+    global _conn, _database
+    if conn is None:
+        import taos
+
+        conn = taos.connect(host=host, port=port, user=user, password=password)
+    conn.execute(f"CREATE DATABASE IF NOT EXISTS {database} PRECISION 'ms'")
+    conn.execute(f"USE {database}")
+    _conn = conn
+    _database = database
+    _created_stables.clear()
+    _existed_tables.clear()
+    return conn
+
+
+def close():
+    global _conn
+    if _conn is not None:
+        _conn.close()
+        _conn = None
+
+
+def _get_conn():
+    if _conn is None:
+        raise RuntimeError("TDengine 未连接，请先调用 connect")
+    return _conn
+
+
+def get_tbname(name, stable=None):
+    """
+    子表名：非字母数字的字符替换为下划线，转为小写(TDengine 表名不区分大小写)，数字开头时加 t_ 前缀
+    结果再次调用时不变，子表名在库中唯一，所以与 stable 无关
+    """
+    tbname = re.sub(r"\W", "_", name).lower()
+    if tbname[:1].isdigit():
+        tbname = f"t_{tbname}"
+    return tbname
+
+
+def create_stable(stable):
+    if stable in _created_stables:
+        return
+    schema = stables[stable]
+    columns = ", ".join(f"{k} {v}" for k, v in schema["columns"].items())
+    tags = ", ".join(f"{k} {v}" for k, v in schema["tags"].items())
+    _get_conn().execute(
+        f"CREATE STABLE IF NOT EXISTS {stable} ({columns}) TAGS ({tags})"
+    )
+    _created_stables.add(stable)
+
+
+def get_existed_tables(stable, refresh=False):
+    """超级表下已存在的子表，第一次调用时查询一次，之后由建表和删表维护"""
+    if refresh or stable not in _existed_tables:
+        create_stable(stable)
+        result = _get_conn().query(
+            "SELECT table_name FROM information_schema.ins_tables "
+            f"WHERE db_name='{_database}' AND stable_name='{stable}'"
+        )
+        _existed_tables[stable] = {row[0] for row in result.fetch_all()}
+    return _existed_tables[stable]
+
+
+def _quote(value):
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def create_child_tables(tbnames, stable, tags, batch_size=1000):
+    """
+    批量创建子表，tags 与 tbnames 一一对应，为超级表 TAGS 顺序的元组
+    已存在的子表跳过，每条 CREATE TABLE 语句最多创建 batch_size 个子表
+    """
+    existed = get_existed_tables(stable)
+    new_tables = {}
+    for name, tag in zip(tbnames, tags):
+        tbname = get_tbname(name, stable)
+        if tbname not in existed:
+            new_tables[tbname] = tag
+    items = list(new_tables.items())
+    for start in range(0, len(items), batch_size):
+        sql = " ".join(
+            f"IF NOT EXISTS {tbname} USING {stable} TAGS ({', '.join(_quote(t) for t in tag)})"
+            for tbname, tag in items[start : start + batch_size]
+        )
+        _get_conn().execute(f"CREATE TABLE {sql}")
+    existed.update(new_tables)
+    if new_tables:
+        logging.info(f"TDengine[{stable}] 新建子表 {len(new_tables)} 个")
+
+
+def drop_tables(names, stable):
+    existed = get_existed_tables(stable)
+    tbnames = [get_tbname(name, stable) for name in names]
+    if not tbnames:
+        return
+    _get_conn().execute(
+        "DROP TABLE " + ", ".join(f"IF EXISTS {tbname}" for tbname in tbnames)
+    )
+    existed.difference_update(tbnames)
+
+
+def _to_epoch_ms(s, tz=default_tz):
+    """时间列转为毫秒时间戳，int64 列视为纳秒时间戳"""
+    if pd.api.types.is_integer_dtype(s):
+        return s.to_numpy(dtype="int64") // 1_000_000
+    s = pd.to_datetime(s)
+    if s.dt.tz is None:
+        s = s.dt.tz_localize(tz)
+    s = s.dt.tz_convert("UTC").dt.tz_localize(None)
+    return (s - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)
+
+
+def _format_column(s, type_):
+    """一列转为 SQL 字面量，空值为 NULL"""
+    if type_ == "timestamp":
+        values = pd.Series(_to_epoch_ms(s), index=s.index).astype(str)
+    elif type_.startswith(("binary", "nchar", "varchar")):
+        values = s.astype(str).map(_quote)
+    elif type_ in ("float", "double"):
+        values = s.astype(str)
+    else:
+        values = s.astype("Int64").astype(str)
+    return values.where(s.notna(), "NULL")
+
+
+def insert(df, name, stable=None, types=None, batch_size=default_batch_size):
+    """
+    批量写入一个子表，每条 INSERT 语句最多 batch_size 行
+    types 为 {列名: TDengine 类型}，决定写入的列和顺序，为空时使用超级表的字段
+    """
+    if df is None or df.empty:
+        return
+    tbname = get_tbname(name, stable)
+    if types is None:
+        types = stables[stable]["columns"]
+    columns = [c for c in types if c in df.columns]
+    values = _format_column(df[columns[0]], types[columns[0]])
+    for c in columns[1:]:
+        values = values + "," + _format_column(df[c], types[c])
+    rows = ("(" + values + ")").to_numpy()
+    head = f"INSERT INTO {tbname} ({', '.join(columns)}) VALUES "
+    conn = _get_conn()
+    for start in range(0, len(rows), batch_size):
+        conn.execute(head + " ".join(rows[start : start + batch_size]))
+    logging.info(f"TDengine[{tbname}] 写入 {len(rows)} 行")
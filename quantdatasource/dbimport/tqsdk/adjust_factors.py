@@ -2,10 +2,12 @@ import logging
 
 import pandas as pd
 
+from quantdatasource.api.raw_format import read_raw
+
 
 def read_adjust_factors(adjust_factors_filepath, cal):
     logging.info("读取价差因子")
-    adjust_df = pd.read_csv(adjust_factors_filepath, index_col=0)
+    adjust_df = read_raw(adjust_factors_filepath, index_col=0)
     adjust_df["symbol"] = adjust_df["symbol"].map(lambda x: x[:-4])
     adjust_df = adjust_df.rename(
         columns={"date": "tradedate", "factor": "adjust_factor"}
@@ -1,12 +1,13 @@
 import logging
-from ast import literal_eval
 
 import pandas as pd
 
+from quantdatasource.api.raw_format import parse_list, read_raw
+
 
 def read_future_basic(future_basic_path):
     logging.info("期货合约基本信息导入完毕")
-    df = pd.read_csv(future_basic_path)
+    df = read_raw(future_basic_path)
     df = df.drop(
         columns=[
             "ins_class",
@@ -30,6 +31,31 @@ def read_future_basic(future_basic_path):
     return df
 
 
+def _seconds_of_day(t):
+    h, m, s = (int(x) for x in t.split(":"))
+    return (h * 3600 + m * 60 + s) % 86400
+
+
+def read_market_times(future_basic_path):
+    """
+    各品种的交易时段 {品种代码(大写): [(开始秒数, 结束秒数), ...]}，日盘在前、夜盘在后
+    夜盘跨过零点的时间(如 25:00:00)按当天的秒数计算
+    """
+    df = read_raw(
+        future_basic_path,
+        columns=["product_id", "trading_time_day", "trading_time_night"],
+    )
+    # 同一品种取最后一个合约的交易时段
+    df = df.drop_duplicates("product_id", keep="last")
+    market_times = {}
+    for row in df.itertuples():
+        periods = parse_list(row.trading_time_day) + parse_list(row.trading_time_night)
+        market_times[row.product_id.upper()] = [
+            (_seconds_of_day(start), _seconds_of_day(end)) for start, end in periods
+        ]
+    return market_times
+
+
 exchange_map = {
     "CZCE": "ZCE",  # 郑州商品交易所
     "SHFE": "SHF",  # 上海期货交易所
@@ -42,11 +68,9 @@ exchange_map = {
 
 def read_future_products_basic(product_basic_path):
     logging.info("读取期货品种基本信息")
-    df = pd.read_csv(product_basic_path, index_col=0)
+    df = read_raw(product_basic_path, index_col=0)
     df.index.name = "_id"
     df = df.reset_index()
     df["exchange"] = df["exchange"].map(exchange_map)
-    df["cont_symbols"] = df["cont_symbols"].apply(
-        lambda x: literal_eval(x) if not pd.isna(x) else []
-    )
+    df["cont_symbols"] = df["cont_symbols"].apply(parse_list)
     return df
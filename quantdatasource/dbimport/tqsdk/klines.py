@@ -6,16 +6,13 @@
 
 import logging
 import re
-from datetime import *
 
+import numpy as np
 import pandas as pd
-import pytz
 
-
-def _convertTradingTime1(timestamp, seconds, dest_tz):
-    dt = datetime.fromtimestamp(timestamp / 1e9) + timedelta(seconds=seconds)
-    tz = pytz.timezone(dest_tz)
-    return tz.localize(dt)
+from quantdatasource.api.raw_format import list_raw_files, read_raw
+from quantdatasource.dbimport.parallel import process_unordered
+from quantdatasource.dbimport.tqsdk.future_basic import read_market_times
 
 
 def _convertColumns(klines: pd.DataFrame):
@@ -29,14 +26,23 @@ def _convertColumns(klines: pd.DataFrame):
     return klines
 
 
-def _commonConvert(klines, seconds, dest_tz):
+def _commonConvert(klines, seconds):
+    """datetime 保持 int64 纳秒时间戳，加上K线周期转为收盘时间，写入数据库前再转为带时区的时间"""
     klines = _convertColumns(klines)
-    klines["datetime"] = klines["datetime"].apply(
-        _convertTradingTime1, args=(seconds, dest_tz)
-    )
+    klines["datetime"] = klines["datetime"].astype("int64") + seconds * 10**9
     return klines
 
 
+def _toDatetime(timestamps, dest_tz):
+    return pd.to_datetime(timestamps, unit="ns", utc=True).tz_convert(dest_tz)
+
+
+def _secondsOfDay(timestamps, dest_tz):
+    """时间戳在 dest_tz 时区的一天中的秒数(精确到分钟)"""
+    dt = _toDatetime(timestamps, dest_tz)
+    return (dt.hour * 3600 + dt.minute * 60).to_numpy()
+
+
 product_types = {
     "T": 2,
     "TS": 2,
@@ -207,30 +213,53 @@ def _ctpHourTimes(interval_str, product_type, timeperiods):
     return None
 
 
-def _aggKlines(klines, interval, product_type, timeperiods):
-    times = _ctpHourTimes(interval, product_type, timeperiods)
-    if not times:
-        return None
-    klines["close_bar"] = klines["datetime"].apply(
-        lambda dt: dt if (dt.hour * 3600 + dt.minute * 60) in times else pd.NaT
-    )
-    klines["close_bar"] = klines["close_bar"].fillna(method="bfill")
-    _klines = []
-    for dt, bars in klines.groupby(by="close_bar"):
-        open, high, low, close = (
-            bars["open"].iloc[0],
-            bars["high"].max(),
-            bars["low"].min(),
-            bars["close"].iloc[-1],
+agg_columns = ["datetime", "open", "high", "low", "close", "volume", "open_interest"]
+
+
+def _aggKlinesAll(klines, intervals, product_type, timeperiods, dest_tz):
+    """
+    按收盘时间表把K线合并为多个周期，返回 {interval: DataFrame}，没有收盘时间表的周期为 None
+    每根K线一天中的秒数只计算一次，各周期用 searchsorted 找出收盘K线，
+    收盘K线及其之前(上一根收盘K线之后)的K线为一组，最后一根收盘K线之后的K线丢弃
+    """
+    dt = klines["datetime"].to_numpy()
+    tod = _secondsOfDay(dt, dest_tz)
+    rows = np.arange(len(klines))
+    open_ = klines["open"].to_numpy()
+    high = klines["high"].to_numpy()
+    low = klines["low"].to_numpy()
+    close = klines["close"].to_numpy()
+    volume = klines["volume"].to_numpy()
+    oi = klines["open_interest"].to_numpy()
+    ret = {}
+    for interval in intervals:
+        times = _ctpHourTimes(interval, product_type, timeperiods)
+        if not times:
+            ret[interval] = None
+            continue
+        times = np.sort(np.asarray(times))
+        idx = np.searchsorted(times, tod).clip(max=len(times) - 1)
+        close_rows = rows[times[idx] == tod]
+        if len(close_rows) == 0:
+            ret[interval] = pd.DataFrame(columns=agg_columns)
+            continue
+        end = close_rows[-1] + 1
+        starts = np.r_[0, close_rows[:-1] + 1]
+        ret[interval] = pd.DataFrame(
+            {
+                "datetime": dt[close_rows],
+                "open": open_[starts],
+                "high": np.maximum.reduceat(high[:end], starts),
+                "low": np.minimum.reduceat(low[:end], starts),
+                "close": close[close_rows],
+                "volume": np.add.reduceat(volume[:end], starts),
+                "open_interest": oi[close_rows],
+            }
         )
-        vol, oi = bars["volume"].sum(), bars["open_interest"].iloc[-1]
-        _klines.append((dt, open, high, low, close, vol, oi))
-    klines = pd.DataFrame(
-        _klines,
-        columns=["datetime", "open", "high", "low", "close", "volume", "open_interest"],
-    )
-    return klines
+    return ret
+
 
+agg_intervals = ["30m", "1H", "2H", "3H", "4H"]
 
 seconds_to_interval = {
     60: "1m",
@@ -241,10 +270,11 @@ seconds_to_interval = {
 }
 
 
-def _save_db(df):
+def _save_db(df, dest_tz):
     if df is None:
         return
     df = df.rename(columns={"datetime": "dt"})
+    df["dt"] = _toDatetime(df["dt"].to_numpy(dtype="int64"), dest_tz)
     df["amount"] = 0
     df = df[["dt", "open", "high", "low", "close", "volume", "amount", "open_interest"]]
     df = df.astype(
@@ -272,44 +302,78 @@ exchange_map = {
 }
 
 
-def read_klines(bars_history_path, bars_current_path):
+def _klines_files(bars_history_path, bars_current_path):
+    for basepath, is_history in [(bars_history_path, True), (bars_current_path, False)]:
+        for csv in list_raw_files(basepath):
+            yield csv, is_history
+
+
+def _read_klines_file(csv, market_times, tz):
+    """
+    读取并转换一个K线文件，返回 (symbol, exchange, [(df, interval), ...])，
+    15m K线同时生成 30m, 1H, 2H, 3H, 4H；多进程导入时在子进程中执行
+    """
+    ret = re.match(r"(\w+)\.(\w+)_(\d+)", csv.stem)
+    exchange, symbol, seconds = ret.group(1), ret.group(2), int(ret.group(3))
+    exchange = exchange_map.get(exchange, "")
+    product_id = _symbolToProductId(symbol)
+    product_type = product_types.get(product_id, 1)
+    itv = seconds_to_interval[seconds]
+    timeperiods = market_times.get(product_id.upper()) if product_id else None
+    if timeperiods is None:
+        logging.error(f"期货K线 {csv} 没有品种 {product_id} 的交易时段")
+        return symbol, exchange, []
+    # if symbol != 'ag2305':
+    #     continue
+    logging.info(
+        (exchange, symbol, seconds, product_id, product_type, itv, timeperiods)
+    )
+    df = read_raw(csv)
+    if df.empty:
+        logging.error(f"期货K线 {csv} 数据为空")
+        return symbol, exchange, []
+    df_ = _commonConvert(df, seconds)
+    results = [(_save_db(df_, tz), itv)]
+    if seconds == 900:
+        # 特殊规则 按15分钟K线生成30m, 1H, 2H, 3H, 4H
+        aggs = _aggKlinesAll(df_, agg_intervals, product_type, timeperiods, tz)
+        for interval in agg_intervals:
+            results.append((_save_db(aggs[interval], tz), interval))
+    return symbol, exchange, results
+
+
+def read_klines(bars_history_path, bars_current_path, future_basic_path):
     logging.info(f"读取期货K线")
-    # TODO: init market times
-    market_times = {}
+    market_times = read_market_times(future_basic_path)
     tz = "Asia/Shanghai"
-    for basepath, is_history in [(bars_history_path, True), (bars_current_path, False)]:
-        for csv in basepath.iterdir():
-            if csv.suffix != ".csv":
-                continue
-            ret = re.match(r"(\w+).(\w+)_(\d+).csv", csv)
-            exchange, symbol, seconds = ret.group(1), ret.group(2), int(ret.group(3))
-            exchange = exchange_map.get(exchange, "")
-            product_id = _symbolToProductId(symbol)
-            product_type = product_types.get(product_id, 1)
-            itv = seconds_to_interval[seconds]
-            timeperiods = market_times[product_id.upper()]
-            # if symbol != 'ag2305':
-            #     continue
-            logging.info(
-                (exchange, symbol, seconds, product_id, product_type, itv, timeperiods)
-            )
-            df = pd.read_csv(csv)
-            if df.empty:
-                logging.error(f"期货K线 {csv} 数据为空")
-                continue
-            df_ = _commonConvert(df, seconds, tz)
-            yield _save_db(df_), symbol, itv, exchange, is_history
-            if seconds == 900:
-                # 特殊规则 按15分钟K线生成30m, 1H, 2H, 3H, 4H
-                df_30m = _aggKlines(df_, "30m", product_type, timeperiods)
-                df_1H = _aggKlines(df_, "1H", product_type, timeperiods)
-                df_2H = _aggKlines(df_, "2H", product_type, timeperiods)
-                df_3H = _aggKlines(df_, "3H", product_type, timeperiods)
-                df_4H = _aggKlines(df_, "4H", product_type, timeperiods)
-                yield _save_db(df_30m), symbol, "30m", exchange, is_history
-                yield _save_db(df_1H), symbol, "1H", exchange, is_history
-                yield _save_db(df_2H), symbol, "2H", exchange, is_history
-                yield _save_db(df_3H), symbol, "3H", exchange, is_history
-                yield _save_db(df_4H), symbol, "4H", exchange, is_history
-        #     break
-        # break
+    for csv, is_history in _klines_files(bars_history_path, bars_current_path):
+        symbol, exchange, results = _read_klines_file(csv, market_times, tz)
+        for df, itv in results:
+            yield df, symbol, itv, exchange, is_history
+
+
+def full_read_klines(
+    bars_history_path,
+    bars_current_path,
+    future_basic_path,
+    processes=None,
+    max_pending=None,
+    skip=None,
+):
+    """
+    多进程读取所有K线文件，按完成顺序每个文件 yield (csv, is_history, symbol, exchange, [(df, interval), ...])
+    processes 和 max_pending 见 process_unordered，skip(csv, is_history) 返回 True 的文件不读取
+    """
+    logging.info(f"多进程读取期货K线")
+    market_times = read_market_times(future_basic_path)
+    tz = "Asia/Shanghai"
+    files = _klines_files(bars_history_path, bars_current_path)
+    tasks = (
+        ((csv, is_history), (csv, market_times, tz))
+        for csv, is_history in files
+        if skip is None or not skip(csv, is_history)
+    )
+    for (csv, is_history), (symbol, exchange, results) in process_unordered(
+        _read_klines_file, tasks, processes, max_pending
+    ):
+        yield csv, is_history, symbol, exchange, results
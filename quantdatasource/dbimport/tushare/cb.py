@@ -3,12 +3,14 @@ from pathlib import Path
 
 import pandas as pd
 
+from quantdatasource.api.raw_format import find_raw, read_raw
+
 intervals = ["1D"]
 
 
 def read_basic(basic_cb_path):
     logging.info("读取可转债基本信息")
-    return pd.read_csv(
+    return read_raw(
         basic_cb_path,
         dtype={
             "ts_code": str,
@@ -25,8 +27,8 @@ def read_basic(basic_cb_path):
 
 
 def read_cb_daily(symbol, cb_daily_path):
-    cb_daily_csv = Path(cb_daily_path, f"{symbol}.csv")
-    df = pd.read_csv(cb_daily_csv)
+    cb_daily_csv = find_raw(Path(cb_daily_path, symbol))
+    df = read_raw(cb_daily_csv)
     if df.empty:
         logging.warning(f"读取可转债日线 {symbol} 为空")
         return
@@ -70,7 +72,7 @@ def addition_read_cb_daily(dt, cb_daily_addition_path, basic_cb_path):
         return
     basic_df = read_basic(basic_cb_path)
     logging.info(f"增量读取可转债日线 {tradedt}")
-    df: pd.DataFrame = pd.read_csv(cb_daily_addition_path, index_col=0)
+    df: pd.DataFrame = read_raw(cb_daily_addition_path, index_col=0)
     df["trade_date"] = pd.to_datetime(df["trade_date"], format="%Y%m%d").astype("datetime64[ms]")
     df = df.reset_index(drop=True)
     df = df.rename(
@@ -125,11 +127,11 @@ def addition_read_cb_daily(dt, cb_daily_addition_path, basic_cb_path):
 
 def read_cb_call(symbol, cb_call_path):
     fields = ["dt", "call_price", "call_price_tax", "is_call", "call_type"]
-    cb_call_csv = Path(cb_call_path, f"{symbol}.csv")
+    cb_call_csv = find_raw(Path(cb_call_path, symbol))
     if not cb_call_csv.exists():
         logging.error(f"可转债赎回数据 {cb_call_csv} not found")
         return pd.DataFrame(columns=fields)
-    df = pd.read_csv(cb_call_csv)
+    df = read_raw(cb_call_csv)
     if df.empty:
         # logging.warning(f"读取可转债赎回数据 {symbol} 为空")
         return pd.DataFrame(columns=fields)
@@ -162,8 +164,8 @@ def read_cb_share(symbol_basic_info, cb_share_path):
     first_conv_price = symbol_basic_info.get("first_conv_price", 0)
     list_date = pd.to_datetime(symbol_basic_info["list_date"], format="%Y%m%d")
     issue_size = symbol_basic_info["issue_size"]
-    cb_share_csv = Path(cb_share_path, f"{symbol}.csv")
-    df = pd.read_csv(cb_share_csv)
+    cb_share_csv = find_raw(Path(cb_share_path, symbol))
+    df = read_raw(cb_share_csv)
     first_day_df = pd.DataFrame(
         {
             "dt": [list_date],
@@ -5,6 +5,9 @@ from pathlib import Path
 
 import pandas as pd
 
+from quantdatasource.api.raw_format import find_raw, list_raw_files, read_raw
+from quantdatasource.dbimport.parallel import process_unordered
+
 
 def _drop_duplicates_of_finance_data(df: pd.DataFrame):
     # BUG: 有些财报的f_ann_date有问题，比如000428.SZ的资产负债表，20091231的年报，是20110225发布的，被当作废弃处理了
@@ -46,9 +49,10 @@ def _process_finance_data(df):
 
 
 def _to_finance_data_q(df: pd.DataFrame):
-    # 将报告期转换为单季度报表
+    # 将报告期转换为单季度报表：同一年内按发布顺序减去上一期，可以同时处理多只股票
     df["year"] = df["end_date"].dt.year
-    res_df = []
+    if df.empty:
+        return df
     non_data_cols = [
         "ts_code",
         "ann_date",
@@ -57,34 +61,56 @@ def _to_finance_data_q(df: pd.DataFrame):
         "comp_type",
         "year",
     ]
-    for _, _df in df.groupby(by="year"):
-        for col in _df.columns:
-            if col in non_data_cols:
-                continue
-            _df[col] = _df[col] - _df[col].shift(1).fillna(0)
-        res_df.append(_df)
-    if res_df:
-        df = pd.concat(res_df)
-        df = df.sort_values(by="end_date", ascending=False).reset_index(drop=True)
-        df = df.drop(columns=["year"])
-    return df
+    data_cols = [col for col in df.columns if col not in non_data_cols]
+    keys = ["ts_code", "year"]
+    # 稳定排序，保持每年内的发布顺序
+    df_q = df.sort_values(by=keys, kind="stable")
+    last = df_q.groupby(by=keys, sort=False)[data_cols].shift(1).fillna(0)
+    df_q[data_cols] = df_q[data_cols] - last
+    df_q = df_q.sort_values(by="end_date", ascending=False).reset_index(drop=True)
+    df_q = df_q.drop(columns=["year"])
+    return df_q
+
+
+def _read_finance_file(csvfile, report_type):
+    """读取并处理一个财报文件，全量导入时在子进程中执行"""
+    df = read_raw(csvfile, index_col=0)
+    if df.empty:
+        return None, None
+    df = _process_finance_data(df)
+    df_q = None
+    if report_type != "balancesheet":
+        df_q = _to_finance_data_q(df)
+    return df, df_q
 
 
 def read_finance_data(finance_path, report_type):
     # 导入财报报表
-    for csvfile in finance_path.iterdir():
-        if csvfile.is_file():
-            symbol = csvfile.name.replace(".csv", "")
-            df = pd.read_csv(csvfile, index_col=0)
-            if df.empty:
-                logging.info(f"{report_type} {symbol} 为空")
-                continue
-            logging.info(f"读取财报 {report_type} {symbol}")
-            df = _process_finance_data(df)
-            df_q = None
-            if report_type != "balancesheet":
-                df_q = _to_finance_data_q(df)
-            yield df, df_q, symbol
+    for csvfile in list_raw_files(finance_path):
+        symbol = csvfile.stem
+        df, df_q = _read_finance_file(csvfile, report_type)
+        if df is None:
+            logging.info(f"{report_type} {symbol} 为空")
+            continue
+        logging.info(f"读取财报 {report_type} {symbol}")
+        yield df, df_q, symbol
+
+
+def full_read_finance_data(finance_path, report_type, processes=None, max_pending=None):
+    """
+    多进程读取所有财报文件，按完成顺序 yield (df, df_q, symbol)
+    processes 和 max_pending 见 process_unordered
+    """
+    files = list_raw_files(finance_path)
+    logging.info(f"全量读取财报 {report_type} {len(files)} 个文件")
+    tasks = ((f.stem, (f, report_type)) for f in files)
+    for symbol, (df, df_q) in process_unordered(
+        _read_finance_file, tasks, processes, max_pending
+    ):
+        if df is None:
+            logging.info(f"{report_type} {symbol} 为空")
+            continue
+        yield df, df_q, symbol
 
 
 def addition_read_finance_data(dt, addition_finance_path):
@@ -92,11 +118,11 @@ def addition_read_finance_data(dt, addition_finance_path):
     enddate = dt.strftime("%Y%m%d")
     trade_yesterday = (dt - timedelta(days=1)).strftime("%Y%m%d")
     for tradedt in [trade_yesterday, enddate]:
-        addition_file = Path(addition_finance_path, f"{tradedt}.csv")
+        addition_file = find_raw(Path(addition_finance_path, tradedt))
         if not addition_file.exists():
             logging.error(f"  {addition_file} 不存在")
             continue
-        fdf: pd.DataFrame = pd.read_csv(addition_file, index_col=0)
+        fdf: pd.DataFrame = read_raw(addition_file, index_col=0)
         if fdf.empty:
             logging.info(f"  财报 {addition_file} 为空")
             continue
@@ -4,6 +4,8 @@ from datetime import *
 
 import pandas as pd
 
+from quantdatasource.api.raw_format import list_raw_files, read_raw
+
 
 def _daily_to_week(df):
     # 合成周线和月线
@@ -28,13 +30,17 @@ def _daily_to_week(df):
     return week_df
 
 
-def read_daily_and_weekly(bars_history_path, bars_current_path):
+def read_daily_and_weekly(bars_history_path, bars_current_path, skip=None):
+    """
+    yield (df, week_df, symbol, exchange, is_history, csv)
+    skip(csv, is_history) 返回 True 的文件不读取
+    """
     logging.info(f"读取期货K线")
     for basepath, is_history in [(bars_history_path, True), (bars_current_path, False)]:
-        for csv in basepath.iterdir():
-            if csv.suffix != ".csv":
+        for csv in list_raw_files(basepath):
+            if skip is not None and skip(csv, is_history):
                 continue
-            ret = re.match(r"(\w+).(\w+).csv", csv)
+            ret = re.match(r"(\w+)\.(\w+)", csv.stem)
             symbol, exchange = ret.group(1), ret.group(2)
             # 只有 CZCE 郑州商品交易所 名称大写
             if exchange != "ZCE" and exchange != "CFX":
@@ -42,7 +48,7 @@ def read_daily_and_weekly(bars_history_path, bars_current_path):
             # if symbol != 'ag2308':
             #     continue
             logging.info((exchange, symbol))
-            df = pd.read_csv(csv, index_col=0, dtype={"trade_date": "string"})
+            df = read_raw(csv, index_col=0, dtype={"trade_date": "string"})
             if df.empty:
                 logging.error(f"期货K线 {csv} 数据为空")
                 continue
@@ -96,4 +102,4 @@ def read_daily_and_weekly(bars_history_path, bars_current_path):
             # print(df)
             # print(df.info())
             week_df = _daily_to_week(df)
-            yield df, week_df, symbol, is_history
+            yield df, week_df, symbol, exchange, is_history, csv
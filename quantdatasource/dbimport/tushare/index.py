@@ -3,12 +3,14 @@ import logging
 
 import pandas as pd
 
+from quantdatasource.api.raw_format import read_raw
+
 
 def addition_read_index(filepath):
     if not filepath.exists():
         logging.info(f"读取大盘指数 没有 {filepath}")
         return None
-    df: pd.DataFrame = pd.read_csv(filepath, index_col=0)
+    df: pd.DataFrame = read_raw(filepath, index_col=0)
     df["trade_date"] = pd.to_datetime(df["trade_date"], format="%Y%m%d")
     df = df.reset_index(drop=True)
     df = df.rename(columns={"trade_date": "dt", "vol": "volume", "ts_code": "symbol"})
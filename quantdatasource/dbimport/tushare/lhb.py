@@ -6,10 +6,12 @@ import logging
 
 import pandas as pd
 
+from quantdatasource.api.raw_format import read_raw
+
 
 def addition_read_lhb(lhb_path, lhb_inst_path):
     logging.info("读取龙虎榜")
-    df: pd.DataFrame = pd.read_csv(lhb_path)
+    df: pd.DataFrame = read_raw(lhb_path)
     df = df.rename(columns={"ts_code": "symbol"})
     many_reason_df = df.loc[df.duplicated(subset=["symbol"], keep=False)]
     df = df.drop_duplicates(subset=["symbol"], keep="last")
@@ -18,8 +20,10 @@ def addition_read_lhb(lhb_path, lhb_inst_path):
     for symbol, sub_mrd in many_reason_df.groupby(by="symbol"):
         data_dct[symbol]["reason"] = sub_mrd["reason"].to_list()
     if lhb_inst_path.exists():
-        inst_df = pd.read_csv(lhb_inst_path)
+        inst_df = read_raw(lhb_inst_path)
         inst_df = inst_df.fillna(0)
+        # tushare 返回的 side 是字符串，parquet 会原样保存
+        inst_df["side"] = inst_df["side"].astype("int8")
         for symbol, sub_inst_df in inst_df.groupby(by="ts_code"):
             _buy_inst_df = sub_inst_df.loc[sub_inst_df["side"] == 0]  # 买入
             _buy_inst_df = _buy_inst_df.drop_duplicates(
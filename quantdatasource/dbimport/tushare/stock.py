@@ -3,14 +3,15 @@ import logging
 import numpy as np
 import pandas as pd
 
-from quantdatasource.dbimport.tushare.stock_utils import maxupordown_status
+from quantdatasource.api.raw_format import read_raw
+from quantdatasource.dbimport.tushare.stock_utils import maxupordown
 
 intervals = ["1D", "w", "mon"]
 
 
 def read_basic(basic_stock_path):
     logging.info("读取证券基本信息")
-    df = pd.read_csv(
+    df = read_raw(
         basic_stock_path, dtype={"list_date": str, "delist_date": str}, index_col=0
     )
     df = df.drop(columns=["symbol"])
@@ -28,116 +29,105 @@ def addition_read_stock_daily_bars(
     chinese_names,
 ):
     today = dt.replace(hour=0, minute=0, second=0, microsecond=0)
-    daily_df = pd.read_csv(daily_bars_addition_path, index_col=0)
-    daily_basic_df = pd.read_csv(daily_basic_addition_path, index_col=0)
-    moneyflow_df = pd.read_csv(moneyflow_addition_path, index_col=0)
+    daily_df = read_raw(daily_bars_addition_path, index_col=0)
+    daily_basic_df = read_raw(daily_basic_addition_path, index_col=0)
+    moneyflow_df = read_raw(moneyflow_addition_path, index_col=0)
     df = pd.merge(daily_df, daily_basic_df, how="left", on=["ts_code", "trade_date"])
     df = pd.merge(df, moneyflow_df, how="left", on=["ts_code", "trade_date"])
     df["trade_date"] = pd.to_datetime(df["trade_date"], format="%Y%m%d")
-    all_datas = []
-    for row in df.itertuples():
-        symbol = row.ts_code
-        if row.open == 0 or row.high == 0 or row.low == 0 or row.close == 0:
-            logging.warning(f"可能是新股：{symbol} ohlc==0")
-            continue
-        # tushare的pe_ttm有空值，如果亏损的话
-        # pe_ttm = row.pe_ttm
-        mkt_cap = row.total_mv * 10000
-        if np.isnan(mkt_cap) or mkt_cap == 0:
-            logging.error(f"{symbol} stock_daily.csv 下载中的市值数据为空，跳过")
-            continue
 
-        stockname = chinese_names.get(symbol, "")
-        if not stockname:
-            logging.error(
-                f"新股：{symbol} 在stock_basic中不存在，但是已经有日线了，需要手动更新股名"
-            )
-        new_kline = {
-            "symbol": symbol,
+    ohlc_zero = (
+        (df["open"] == 0) | (df["high"] == 0) | (df["low"] == 0) | (df["close"] == 0)
+    )
+    for symbol in df.loc[ohlc_zero, "ts_code"]:
+        logging.warning(f"可能是新股：{symbol} ohlc==0")
+    df = df.loc[~ohlc_zero]
+    # tushare的pe_ttm有空值，如果亏损的话
+    # pe_ttm = row.pe_ttm
+    mkt_cap = df["total_mv"] * 10000
+    no_mkt_cap = mkt_cap.isna() | (mkt_cap == 0)
+    for symbol in df.loc[no_mkt_cap, "ts_code"]:
+        logging.error(f"{symbol} stock_daily 下载中的市值数据为空，跳过")
+    df = df.loc[~no_mkt_cap].reset_index(drop=True)
+    mkt_cap = mkt_cap.loc[~no_mkt_cap].reset_index(drop=True)
+
+    names = df["ts_code"].map(chinese_names).fillna("")
+    for symbol in df.loc[names == "", "ts_code"]:
+        logging.error(
+            f"新股：{symbol} 在stock_basic中不存在，但是已经有日线了，需要手动更新股名"
+        )
+    kline = pd.DataFrame(
+        {
+            "symbol": df["ts_code"],
             "dt": today,
-            "name": stockname,
-            "open": row.open,
-            "high": row.high,
-            "low": row.low,
-            "close": row.close,
-            "preclose": row.pre_close,
-            "volume": row.vol * 100,
-            "amount": row.amount * 1000,
-            "pb": row.pb,
+            "name": names,
+            "open": df["open"],
+            "high": df["high"],
+            "low": df["low"],
+            "close": df["close"],
+            "preclose": df["pre_close"],
+            "volume": df["vol"] * 100,
+            "amount": df["amount"] * 1000,
+            "pb": df["pb"],
             "mkt_cap": mkt_cap,
-            "mkt_cap_ashare": row.circ_mv * 10000,
-            "vip_buy_amt": row.buy_lg_amount,
-            "vip_sell_amt": row.sell_lg_amount,
-            "inst_buy_amt": row.buy_elg_amount,
-            "inst_sell_amt": row.sell_elg_amount,
-            "mid_buy_amt": row.buy_md_amount,
-            "mid_sell_amt": row.sell_md_amount,
-            "indi_buy_amt": row.buy_sm_amount,
-            "indi_sell_amt": row.sell_sm_amount,
-            "turnover": row.turnover_rate / 100,
-            "free_shares": row.float_share * 10000,
-            "total_shares": row.total_share * 10000,
-            "maxupordown": 0,
+            "mkt_cap_ashare": df["circ_mv"] * 10000,
+            "vip_buy_amt": df["buy_lg_amount"],
+            "vip_sell_amt": df["sell_lg_amount"],
+            "inst_buy_amt": df["buy_elg_amount"],
+            "inst_sell_amt": df["sell_elg_amount"],
+            "mid_buy_amt": df["buy_md_amount"],
+            "mid_sell_amt": df["sell_md_amount"],
+            "indi_buy_amt": df["buy_sm_amount"],
+            "indi_sell_amt": df["sell_sm_amount"],
+            "turnover": df["turnover_rate"] / 100,
+            "free_shares": df["float_share"] * 10000,
+            "total_shares": df["total_share"] * 10000,
         }
-        # 从2026年6月16号开始，limit_status有变
-        # 收盘涨跌状态：0-平盘，1-上涨(不含涨停)，2-涨停(不含一字涨停)，3-一字涨停，4-下跌(不含跌停)，5-跌停(不含一字跌停)，6-一字跌停
-        if row.limit_status in [0, 1, 4]:
-            maxupordown = 0
-        elif row.limit_status == 2:
-            maxupordown = 1
-        elif row.limit_status == 3:
-            maxupordown = 2
-        elif row.limit_status == 5:
-            maxupordown = -1
-        elif row.limit_status == 6:
-            maxupordown = -2
-        if pd.isna(maxupordown):
-            maxupordown = maxupordown_status(symbol, row.close, new_kline)
-            if row.high == row.low:
-                maxupordown = 2 * maxupordown
-        new_kline["maxupordown"] = maxupordown
-        new_kline["vip_net_flow_in"] = (
-            new_kline["vip_buy_amt"] - new_kline["vip_sell_amt"]
-        )
-        new_kline["inst_net_flow_in"] = (
-            new_kline["inst_buy_amt"] - new_kline["inst_sell_amt"]
-        )
-        new_kline["mid_net_flow_in"] = (
-            new_kline["mid_buy_amt"] - new_kline["mid_sell_amt"]
-        )
-        new_kline["indi_net_flow_in"] = (
-            new_kline["indi_buy_amt"] - new_kline["indi_sell_amt"]
-        )
-        new_kline["master2_net_flow_in"] = (
-            new_kline["mid_net_flow_in"]
-            + new_kline["vip_net_flow_in"]
-            + new_kline["inst_net_flow_in"]
-        )
-        new_kline["master_net_flow_in"] = (
-            new_kline["vip_net_flow_in"] + new_kline["inst_net_flow_in"]
-        )
-        new_kline["total_sell_amt"] = (
-            new_kline["mid_sell_amt"]
-            + new_kline["indi_sell_amt"]
-            + new_kline["vip_sell_amt"]
-            + new_kline["inst_sell_amt"]
-        )
-        new_kline["total_buy_amt"] = (
-            new_kline["mid_buy_amt"]
-            + new_kline["indi_buy_amt"]
-            + new_kline["vip_buy_amt"]
-            + new_kline["inst_buy_amt"]
-        )
-        new_kline["net_flow_in"] = (
-            new_kline["total_buy_amt"] - new_kline["total_sell_amt"]
-        )
-        new_kline["maxupordown_at_open"] = maxupordown_status(
-            symbol, row.open, new_kline
-        )
+    )
 
-        all_datas.append(new_kline)
+    close_status, open_status = maxupordown(
+        kline["symbol"],
+        kline["name"],
+        kline["open"],
+        kline["high"],
+        kline["low"],
+        kline["close"],
+        kline["preclose"],
+    )
+    # 从2026年6月16号开始，limit_status有变
+    # 收盘涨跌状态：0-平盘，1-上涨(不含涨停)，2-涨停(不含一字涨停)，3-一字涨停，4-下跌(不含跌停)，5-跌停(不含一字跌停)，6-一字跌停
+    if "limit_status" in df:
+        limit_status = pd.to_numeric(df["limit_status"], errors="coerce")
+    else:
+        limit_status = pd.Series(np.nan, index=df.index)
+    status = limit_status.map({0: 0, 1: 0, 4: 0, 2: 1, 3: 2, 5: -1, 6: -2})
+    # 没有 limit_status 时按涨跌停价计算
+    kline["maxupordown"] = status.fillna(pd.Series(close_status, index=df.index))
+
+    kline["vip_net_flow_in"] = kline["vip_buy_amt"] - kline["vip_sell_amt"]
+    kline["inst_net_flow_in"] = kline["inst_buy_amt"] - kline["inst_sell_amt"]
+    kline["mid_net_flow_in"] = kline["mid_buy_amt"] - kline["mid_sell_amt"]
+    kline["indi_net_flow_in"] = kline["indi_buy_amt"] - kline["indi_sell_amt"]
+    kline["master2_net_flow_in"] = (
+        kline["mid_net_flow_in"] + kline["vip_net_flow_in"] + kline["inst_net_flow_in"]
+    )
+    kline["master_net_flow_in"] = kline["vip_net_flow_in"] + kline["inst_net_flow_in"]
+    kline["total_sell_amt"] = (
+        kline["mid_sell_amt"]
+        + kline["indi_sell_amt"]
+        + kline["vip_sell_amt"]
+        + kline["inst_sell_amt"]
+    )
+    kline["total_buy_amt"] = (
+        kline["mid_buy_amt"]
+        + kline["indi_buy_amt"]
+        + kline["vip_buy_amt"]
+        + kline["inst_buy_amt"]
+    )
+    kline["net_flow_in"] = kline["total_buy_amt"] - kline["total_sell_amt"]
+    kline["maxupordown_at_open"] = open_status
 
-    df = pd.DataFrame(all_datas)
+    df = kline
     df = df.astype(
         {
             "dt": "datetime64[ms]",
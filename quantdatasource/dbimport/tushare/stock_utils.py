@@ -1,67 +1,104 @@
+"""
+涨跌停计算，整个截面或者整段历史一次计算
+"""
+
 from decimal import ROUND_HALF_UP, Decimal
 
+import numpy as np
 import pandas as pd
 
-
-def my_round(a):
-    return float(a.quantize(Decimal("1.00"), rounding=ROUND_HALF_UP))
+# 创业板注册制改革，2020年8月24日起涨跌幅为20%
+gem_reform_date = np.datetime64("2020-08-24")
+# 尚未进行股权分置改革以S开头，2007年1月8日起，日涨跌幅调整为上下5%
+s_stock_date = np.datetime64("2007-01-08")
 
 
 def to_decimal(a):
     return Decimal(a).quantize(Decimal("1.00"), rounding=ROUND_HALF_UP)
 
 
-def apply_yiziban(row):
-    if row["open"] == row["high"] == row["low"] == row["close"]:
-        return 2
+def round_half_up_cents(a):
+    """
+    价格数组按 ROUND_HALF_UP 保留两位小数，返回以分为单位的整数值(float，空值保留为 nan)，
+    与 to_decimal 逐个计算的结果一致
+    """
+    a = np.asarray(a, dtype="float64")
+    scaled = a * 100
+    cents = np.floor(scaled + 0.5)
+    # a*100 有浮点误差，只有离 0.5 分很近的价格需要用 Decimal 精确判断
+    frac = scaled - np.floor(scaled)
+    for i in np.flatnonzero(np.abs(frac - 0.5) < 1e-6):
+        cents[i] = int(to_decimal(a[i]) * 100)
+    return cents
+
+
+def _str_flags(values, *conds):
+    """整段历史中代码和名称重复很多，只对不同的值做字符串判断"""
+    codes, uniques = pd.factorize(pd.Series(values))
+    uniques = pd.Series(uniques, dtype="string")
+    # 空值的 code 为 -1，对应末尾补的 False
+    return [np.append(cond(uniques).to_numpy(bool), False)[codes] for cond in conds]
+
+
+def updown_perctg(symbols, names, dates=None):
+    """
+    涨跌幅限制(百分比整数)，dates 为空时按当前规则
+    """
+    bj, star, gem = _str_flags(
+        symbols,
+        lambda s: s.str.endswith("BJ"),  # 北交所
+        lambda s: s.str.startswith("68"),  # 科创板
+        lambda s: s.str.startswith("3"),  # 创业板
+    )
+    st, s_stock = _str_flags(
+        names,
+        lambda s: s.str.contains("ST") | s.str.contains("退"),
+        lambda s: s.str.startswith("S"),
+    )
+    perctg = np.full(len(gem), 10)
+    perctg[bj] = 30
+    perctg[star] = 20
+    if dates is not None:
+        dates = np.asarray(dates, dtype="datetime64[ns]")
+        gem = gem & (dates >= gem_reform_date)
+        s_stock = s_stock & (dates >= s_stock_date)
     else:
-        return 1
-
-
-def _set_updown_perctg(symbol, df):
-    df["updown_perctg"] = 0.1
-    if symbol.startswith("3"):  # 创业板
-        df.loc[df.index > pd.Timestamp(2020, 8, 23), "updown_perctg"] = 0.2
-    elif symbol.startswith("68"):  # 科创板
-        df["updown_perctg"] = 0.2
-    elif symbol.endswith("BJ"):  # 北交所
-        df["updown_perctg"] = 0.3
-    df.loc[df["name"].astype(str).str.contains("ST"), "updown_perctg"] = 0.05
-    df.loc[df["name"].astype(str).str.contains("退"), "updown_perctg"] = 0.05
-    # 尚未进行股权分置改革以S开头，2007年1月8日起，日涨跌幅调整为上下5%
-    df.loc[
-        (df["name"].astype(str).str.contains("S"))
-        & (df.index > pd.Timestamp(2007, 1, 7)),
-        "updown_perctg",
-    ] = 0.05
-    # print(df['updown_perctg'])
-
-
-def maxupordown_status(symbol, price, kline):
-    # 计算涨跌停价格
-    stock_name = kline["name"]
-    updown_perctg = 0.1
-    if symbol.startswith("3"):  # 创业板
-        updown_perctg = 0.2
-    elif symbol.startswith("68"):  # 科创板
-        updown_perctg = 0.2
-    elif symbol.endswith("BJ"):  # 北交所
-        updown_perctg = 0.3
-    if "ST" in stock_name:
-        updown_perctg = 0.05
-    if "退" in stock_name:
-        updown_perctg = 0.05
-
-    preclose = kline["preclose"]
-
-    preclose = to_decimal(preclose)
-    updown_perctg = to_decimal(updown_perctg)
-    yiziban = apply_yiziban(kline)
-    change = preclose * updown_perctg
-    upper_price = preclose + change
-    lower_price = preclose - change
-    upper_price = my_round(upper_price)
-    lower_price = my_round(lower_price)
-    upper_diff = 1 if abs(price - upper_price) < 0.001 else 0
-    lower_diff = -1 if abs(price - lower_price) < 0.001 else 0
-    return (upper_diff + lower_diff) * yiziban
+        # 当前规则下 S 开头的股票(未股改)按普通股票处理
+        s_stock = np.zeros_like(s_stock)
+    perctg[gem] = 20
+    perctg[st | s_stock] = 5
+    return perctg
+
+
+def limit_prices(preclose, perctg):
+    """
+    涨停价、跌停价，按 ROUND_HALF_UP 保留两位小数
+    """
+    preclose_cents = round_half_up_cents(preclose)
+    # 用整数(分)计算，昨收 * (100 ± 涨跌幅) 单位是万分之一元，再四舍五入到分
+    upper = (preclose_cents * (100 + perctg) + 50) // 100
+    lower = (preclose_cents * (100 - perctg) + 50) // 100
+    return upper / 100, lower / 100
+
+
+def _limit_status(price, upper, lower):
+    price = np.asarray(price, dtype="float64")
+    return np.where(np.abs(price - upper) < 0.001, 1, 0) + np.where(
+        np.abs(price - lower) < 0.001, -1, 0
+    )
+
+
+def maxupordown(symbols, names, open, high, low, close, preclose, dates=None):
+    """
+    返回 (maxupordown, maxupordown_at_open) 两个 int8 数组
+    1:涨停 -1:跌停 0:其他，一字板(开高低收相同)时为 2 和 -2
+    """
+    open, high, low, close = (
+        np.asarray(x, dtype="float64") for x in (open, high, low, close)
+    )
+    perctg = updown_perctg(symbols, names, dates)
+    upper, lower = limit_prices(preclose, perctg)
+    yiziban = np.where((open == high) & (high == low) & (low == close), 2, 1)
+    close_status = _limit_status(close, upper, lower) * yiziban
+    open_status = _limit_status(open, upper, lower) * yiziban
+    return close_status.astype("int8"), open_status.astype("int8")
@@ -4,10 +4,12 @@ from datetime import datetime
 
 import pandas as pd
 
+from quantdatasource.api.raw_format import list_raw_files, read_raw
+
 
 def read_ths_concepts_basic(csv):
     logging.info("读取同花顺概念板块基本信息")
-    df = pd.read_csv(
+    df = read_raw(
         csv, dtype={"list_date": str, "ts_code": str, "name": str}, index_col=0
     )
     df["count"] = df["count"].fillna(0)
@@ -20,8 +22,8 @@ def read_ths_concepts_constituent(ths_concepts_members_path):
     logging.info("读取同花顺概念成分股数据")
     dt = datetime.today()
     data = []
-    for members_csv in ths_concepts_members_path.iterdir():
-        members_df = pd.read_csv(members_csv)
+    for members_csv in list_raw_files(ths_concepts_members_path):
+        members_df = read_raw(members_csv)
         for row in members_df.itertuples():
             data.append((datetime(dt.year, dt.month, dt.day), row.code, 1, row.ts_code))
     df = pd.DataFrame(data, columns=["tradedate", "stock_code", "op", "index_code"])
@@ -50,14 +52,14 @@ def addition_read_ths_concepts_constituent(
 ):
     logging.info("增量读取同花顺概念成分股数据")
     addition_rows = []
-    for members_csv in ths_concepts_members_path.iterdir():
-        symbol = members_csv.name.replace(".csv", "")
+    for members_csv in list_raw_files(ths_concepts_members_path):
+        symbol = members_csv.stem
         if not all_ths_index_df.empty:
             ths_idx_df = all_ths_index_df.loc[all_ths_index_df["index_code"] == symbol]
             stocks = _get_current_constituent_of_index(ths_idx_df)
         else:
             stocks = set()
-        members_df = pd.read_csv(members_csv, index_col=0)
+        members_df = read_raw(members_csv, index_col=0)
         if members_df.empty:
             logging.warning(f"无法增量导入概念成分股：{members_csv} 为空")
             continue
@@ -93,10 +95,8 @@ def addition_read_ths_concepts_constituent(
 
 def read_concepts_bars(ths_daily_bars_path):
     logging.info("全量读取同花顺概念日线")
-    for csvfile in ths_daily_bars_path.iterdir():
-        if csvfile.suffix != ".csv":
-            continue
-        df: pd.DataFrame = pd.read_csv(csvfile, index_col=0)
+    for csvfile in list_raw_files(ths_daily_bars_path):
+        df: pd.DataFrame = read_raw(csvfile, index_col=0)
         df = df.iloc[::-1]
         df["trade_date"] = pd.to_datetime(df["trade_date"], format="%Y%m%d")
         df = df.drop(columns=["pre_close", "ts_code"])
@@ -125,7 +125,7 @@ def addition_read_concepts_bars(csv, concepts_basic_df):
     if not csv.exists():
         logging.error(f"同花顺概念日线没有 {csv} 数据")
         return
-    df: pd.DataFrame = pd.read_csv(csv, index_col=0)
+    df: pd.DataFrame = read_raw(csv, index_col=0)
     df["trade_date"] = pd.to_datetime(df["trade_date"], format="%Y%m%d")
     df = df.reset_index(drop=True)
     df = df.rename(columns={"trade_date": "dt", "vol": "volume", "ts_code": "symbol"})
@@ -1,4 +1,6 @@
 from quantdatasource.jobs.ctp_download_contracts import *
+from quantdatasource.jobs.daily_factors_transpose import *
+from quantdatasource.jobs.dataset_compact import *
 from quantdatasource.jobs.eastmoney_analyst_reports import *
 from quantdatasource.jobs.ths_hot_stocks import *
 from quantdatasource.jobs.tqsdk_calc_adj_factors import *
@@ -6,5 +8,6 @@ from quantdatasource.jobs.tqsdk_future_bars import *
 from quantdatasource.jobs.tqsdk_future_basic import *
 from quantdatasource.jobs.tushare_cb_daily import *
 from quantdatasource.jobs.tushare_cb_data import *
+from quantdatasource.jobs.tushare_finance_full import *
 from quantdatasource.jobs.tushare_index_bars import *
 from quantdatasource.jobs.tushare_misc_data import *
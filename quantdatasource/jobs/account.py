@@ -7,6 +7,11 @@ raw_future_output = ""
 astock_output = ""
 future_output = ""
 tushare_token = ""
+tushare_rate_limits = {}
+tushare_workers = 4
+raw_format = "parquet"
+import_processes = None
+tdengine = {}
 tq_username = ""
 tq_psw = ""
 
@@ -23,6 +28,11 @@ with open("quantdatasource_config.yml", "r") as f:
     pathlib.Path(astock_output).mkdir(parents=True, exist_ok=True)
     pathlib.Path(future_output).mkdir(parents=True, exist_ok=True)
     tushare_token = config["tushare_token"]
+    tushare_rate_limits = config.get("tushare_rate_limits", {})
+    tushare_workers = config.get("tushare_workers", 4)
+    raw_format = config.get("raw_format", "parquet")
+    import_processes = config.get("import_processes")
+    tdengine = config.get("tdengine", {})
     tq_username = config["tq_username"]
     tq_psw = config["tq_psw"]
     ctp_accounts = config["ctp_accounts"]
@@ -0,0 +1,27 @@
+import pathlib
+
+from quantdatasource.jobs import account, symbol_history
+from quantdatasource.jobs.scheduler import job
+
+__all__ = ["daily_factors_transpose"]
+
+
+# 在每日截面数据写入之后，把新增的日期按 symbol 追加到分桶的历史数据
+@job(
+    trigger="cron",
+    id="astock_daily_factors_transpose",
+    name="[Parquet]日线因子按symbol转置",
+    replace_existing=True,
+    hour=1,
+    minute=30,
+    misfire_grace_time=200,
+)
+def daily_factors_transpose(dt, is_collect, is_import):
+    if not is_import:
+        return
+    output_dir = pathlib.Path(account.astock_output)
+    symbol_history.transpose(
+        output_dir / "daily_factors",
+        output_dir / "daily_factors_by_symbol",
+        dt.date(),
+    )
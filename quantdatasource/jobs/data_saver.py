@@ -1,23 +1,190 @@
 import logging
+import queue
+import threading
 
-import pandas as pd
+import numpy as np
+from pymongo import IndexModel, UpdateOne
 from quantdata import get_conn_mongodb
 
+default_batch_size = 10000
+staging_suffix = "__staging"
 
-def _insert_many(coll, df):
-    coll.insert_many(df.to_dict(orient="records"))
 
+def _iter_batches(df, ignore_nan=False, batch_size=default_batch_size):
+    """
+    分批把 DataFrame 转为 dict 列表，不会一次生成所有记录
+    ignore_nan=True 时按列找出空值，只删除空值所在的字段
+    """
+    for start in range(0, len(df), batch_size):
+        batch = df.iloc[start : start + batch_size]
+        records = batch.to_dict(orient="records")
+        if ignore_nan:
+            isna = batch.isna().to_numpy()
+            for j in np.flatnonzero(isna.any(axis=0)):
+                col = batch.columns[j]
+                for i in np.flatnonzero(isna[:, j]):
+                    del records[i][col]
+        yield records
 
-def _insert_many_ignore_nan(coll, df):
-    data = df.to_dict(orient="records")
-    for dct in data:
-        del_ks = []
-        for k, v in dct.items():
-            if pd.isna(v):
-                del_ks.append(k)
-        for k in del_ks:
-            dct.pop(k)
-    coll.insert_many(data)
+
+def _insert_many(coll, df, batch_size=default_batch_size):
+    for records in _iter_batches(df, batch_size=batch_size):
+        coll.insert_many(records, ordered=False)
+
+
+def _insert_many_ignore_nan(coll, df, batch_size=default_batch_size):
+    for records in _iter_batches(df, ignore_nan=True, batch_size=batch_size):
+        coll.insert_many(records, ordered=False)
+
+
+def _upsert_many(coll, df, keys, ignore_nan=False, batch_size=default_batch_size):
+    # keys 字段为空值的行无法确定要更新的记录，不写入
+    null_keys = df[keys].isna().any(axis=1)
+    if null_keys.any():
+        logging.warning(
+            f"MongoDB[{coll.name}] {null_keys.sum()} 行 {keys} 为空，不写入"
+        )
+        df = df.loc[~null_keys]
+    for records in _iter_batches(df, ignore_nan, batch_size):
+        coll.bulk_write(
+            [
+                UpdateOne({k: rec[k] for k in keys}, {"$set": rec}, upsert=True)
+                for rec in records
+            ],
+            ordered=False,
+        )
+
+
+def _index_models(coll):
+    """原集合上的索引(_id 除外)"""
+    models = []
+    for name, info in coll.index_information().items():
+        if name == "_id_":
+            continue
+        opts = {k: v for k, v in info.items() if k not in ("key", "v", "ns")}
+        models.append(IndexModel(info["key"], name=name, **opts))
+    return models
+
+
+def _staging_collection(db, collection_name):
+    staging_name = f"{collection_name}{staging_suffix}"
+    db.drop_collection(staging_name)
+    return db[staging_name]
+
+
+def _swap_staging(db, collection_name, indexes=None):
+    """临时集合建好索引后 rename(dropTarget=True) 原子替换原集合，indexes 为空时沿用原集合的索引"""
+    staging = db[f"{collection_name}{staging_suffix}"]
+    if indexes is None and collection_name in db.list_collection_names():
+        indexes = _index_models(db[collection_name])
+    if indexes:
+        staging.create_indexes(indexes)
+    staging.rename(collection_name, dropTarget=True)
+
+
+def _swap_collection(db, collection_name, df, ignore_nan, batch_size, indexes=None):
+    """
+    先写入临时集合再原子替换原集合，
+    写入期间读取方看到的始终是完整的旧数据，写入失败时旧数据不受影响
+    """
+    staging = _staging_collection(db, collection_name)
+    try:
+        _write = _insert_many_ignore_nan if ignore_nan else _insert_many
+        _write(staging, df, batch_size)
+        _swap_staging(db, collection_name, indexes)
+    except Exception:
+        db.drop_collection(staging.name)
+        raise
+
+
+class MongoBulkWriter:
+    """
+    单独一个写入线程，生产者通过有界队列提交 (集合名, DataFrame)，
+    各集合的记录攒够 batch_size 条后一次 insert_many，写入跟不上时 put 会阻塞
+    replace=True 时写入临时集合，close 时再原子替换原集合
+    """
+
+    def __init__(
+        self,
+        dbname,
+        replace=False,
+        ignore_nan=False,
+        batch_size=default_batch_size,
+        queue_size=64,
+    ):
+        self.db = get_conn_mongodb()[dbname]
+        self.replace = replace
+        self.ignore_nan = ignore_nan
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.colls = {}
+        self.buffers = {}
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, collection_name, df):
+        if self.error is not None:
+            raise self.error
+        if df is not None and not df.empty:
+            self.queue.put((collection_name, df))
+
+    def _coll(self, collection_name):
+        if collection_name not in self.colls:
+            if self.replace:
+                coll = _staging_collection(self.db, collection_name)
+            else:
+                coll = self.db[collection_name]
+            self.colls[collection_name] = coll
+        return self.colls[collection_name]
+
+    def _flush(self, collection_name):
+        records = self.buffers.pop(collection_name, None)
+        if records:
+            self._coll(collection_name).insert_many(records, ordered=False)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                # 出错后继续取出队列中的数据，避免生产者阻塞
+                continue
+            collection_name, df = item
+            try:
+                buffer = self.buffers.setdefault(collection_name, [])
+                for records in _iter_batches(df, self.ignore_nan, self.batch_size):
+                    buffer.extend(records)
+                if len(buffer) >= self.batch_size:
+                    self._flush(collection_name)
+            except Exception as e:
+                self.error = e
+        if self.error is None:
+            try:
+                for collection_name in list(self.buffers):
+                    self._flush(collection_name)
+            except Exception as e:
+                self.error = e
+
+    def close(self, swap=True):
+        self.queue.put(None)
+        self.thread.join()
+        if self.replace:
+            for collection_name, coll in self.colls.items():
+                if swap and self.error is None:
+                    _swap_staging(self.db, collection_name)
+                    logging.info(f"替换MongoDB[{self.db.name}][{collection_name}]")
+                else:
+                    self.db.drop_collection(coll.name)
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(swap=exc_type is None)
 
 
 def mongo_delete_fields(coll, fields):
@@ -25,13 +192,48 @@ def mongo_delete_fields(coll, fields):
     coll.update_many({}, new_, False)
 
 
-def mongo_insert_many(df, dbname, collection_name, ignore_nan=False, drop=True):
-    logging.info(f"写入MongoDB[{dbname}][{collection_name}]")
+def mongo_bulk_write(
+    df,
+    dbname,
+    collection_name,
+    mode="replace",
+    keys=None,
+    ignore_nan=False,
+    batch_size=default_batch_size,
+    indexes=None,
+):
+    """
+    分批写入MongoDB(ordered=False)
+    mode:
+        replace: 写入临时集合后原子替换原集合，indexes 为新集合的索引(IndexModel 列表)，为空时沿用原集合的索引
+        append: 追加写入
+        upsert: 按 keys 字段更新，不存在则插入(ignore_nan 时空值字段保留原值)
+    """
+    logging.info(f"写入MongoDB[{dbname}][{collection_name}] {mode}")
     conn = get_conn_mongodb()
     db = conn[dbname]
-    if drop:
-        db.drop_collection(collection_name)
-    if ignore_nan:
-        _insert_many_ignore_nan(db[collection_name], df)
+    coll = db[collection_name]
+    if df is None or df.empty:
+        logging.warning(f"MongoDB[{dbname}][{collection_name}] 没有数据写入")
+        return
+    if mode == "replace":
+        _swap_collection(db, collection_name, df, ignore_nan, batch_size, indexes)
+    elif mode == "append":
+        _write = _insert_many_ignore_nan if ignore_nan else _insert_many
+        _write(coll, df, batch_size)
+    elif mode == "upsert":
+        if not keys:
+            raise ValueError("upsert 模式必须指定 keys")
+        _upsert_many(coll, df, keys, ignore_nan, batch_size)
     else:
-        _insert_many(db[collection_name], df)
+        raise ValueError(f"不支持的写入模式 {mode}")
+
+
+def mongo_insert_many(df, dbname, collection_name, ignore_nan=False, drop=True):
+    mongo_bulk_write(
+        df,
+        dbname,
+        collection_name,
+        mode="replace" if drop else "append",
+        ignore_nan=ignore_nan,
+    )
@@ -0,0 +1,29 @@
+import pathlib
+
+from quantdatasource.jobs import account, dataset_saver, index_bars, symbol_history
+from quantdatasource.jobs.scheduler import job
+
+__all__ = ["dataset_compact"]
+
+datasets = ["daily_factors", "bars_cb_daily", "bars_ths_index_daily"]
+
+
+# 每周日凌晨压缩
+@job(
+    trigger="cron",
+    id="astock_dataset_compact",
+    name="[Parquet]每日截面数据按月压缩",
+    replace_existing=True,
+    day_of_week=6,
+    hour=3,
+    misfire_grace_time=200,
+)
+def dataset_compact(dt, is_collect, is_import):
+    if not is_import:
+        return
+    output_dir = pathlib.Path(account.astock_output)
+    for name in datasets:
+        dataset_saver.compact_dataset(output_dir / name)
+    symbol_history.compact_history(output_dir / "daily_factors_by_symbol")
+    for period in ["daily", "week", "mon"]:
+        index_bars.compact(output_dir / "bars_index" / period)
@@ -0,0 +1,96 @@
+"""
+每日截面数据(daily_factors, bars_cb_daily, bars_ths_index_daily)保存为按 year/month 分区(hive 风格)的 parquet 数据集
+每天写入当月目录下的 {date}.parquet，定期压缩为每月一个按 (symbol, dt) 排序的 compacted.parquet，
+读取时按 dt 过滤只打开一个月的目录，按 symbol 过滤时每个月只读取 row group 统计信息匹配的部分：
+    pd.read_parquet(dataset_dir, filters=[("symbol", "==", "000001.SZ")])
+"""
+
+import datetime
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from quantdatasource.api.utils import atomic_write
+
+compacted_name = "compacted.parquet"
+default_row_group_size = 20000
+
+
+def partition_dir(dataset_dir, date):
+    return Path(dataset_dir, f"year={date.year}", f"month={date.month:02d}")
+
+
+def _write(df, path, row_group_size=default_row_group_size):
+    with atomic_write(path) as tmp:
+        df.to_parquet(
+            tmp, index=False, compression="zstd", row_group_size=row_group_size
+        )
+
+
+def _remove_date_from_compacted(part, date):
+    """重新写入已压缩的日期时，先从 compacted.parquet 中删除这一天的数据，避免重复"""
+    compacted = part / compacted_name
+    if not compacted.exists():
+        return
+    dt = pd.Timestamp(date)
+    dts = pq.read_table(compacted, columns=["dt"]).column("dt").to_pandas()
+    if not (dts == dt).any():
+        return
+    df = pd.read_parquet(compacted)
+    _write(df.loc[df["dt"] != dt], compacted)
+    logging.info(f"从[{compacted}]中删除 {date}")
+
+
+def append_day(df, dataset_dir, date):
+    """写入一天所有 symbol 的数据，按 symbol 排序"""
+    if df is None or df.empty:
+        logging.warning(f"[{dataset_dir}] {date} 没有数据写入")
+        return None
+    part = partition_dir(dataset_dir, date)
+    part.mkdir(parents=True, exist_ok=True)
+    _remove_date_from_compacted(part, date)
+    path = part / f"{date.isoformat()}.parquet"
+    df = df.sort_values("symbol", kind="stable").reset_index(drop=True)
+    _write(df, path)
+    logging.info(f"写入[{path}]")
+    return path
+
+
+def compact_month(part, row_group_size=default_row_group_size):
+    """把一个月的每日文件和已有的 compacted.parquet 合并为一个按 (symbol, dt) 排序的文件"""
+    files = sorted(f for f in part.glob("*.parquet") if f.name != compacted_name)
+    if not files:
+        return
+    compacted = part / compacted_name
+    dfs = [pd.read_parquet(f) for f in files]
+    if compacted.exists():
+        dfs.insert(0, pd.read_parquet(compacted))
+    df = pd.concat(dfs, ignore_index=True)
+    df = df.sort_values(["symbol", "dt"], kind="stable").reset_index(drop=True)
+    _write(df, compacted, row_group_size)
+    for f in files:
+        os.remove(f)
+    logging.info(f"压缩[{part}] {len(files)} 个文件")
+
+
+def move_legacy_files(dataset_dir):
+    """旧的按天平铺在根目录的 {date}.parquet 移入对应的分区目录"""
+    for f in Path(dataset_dir).glob("*.parquet"):
+        date = datetime.date.fromisoformat(f.stem)
+        part = partition_dir(dataset_dir, date)
+        part.mkdir(parents=True, exist_ok=True)
+        _remove_date_from_compacted(part, date)
+        os.replace(f, part / f.name)
+
+
+def compact_dataset(dataset_dir, row_group_size=default_row_group_size):
+    """压缩数据集中所有月份的每日文件，旧的平铺文件先移入分区目录"""
+    dataset_dir = Path(dataset_dir)
+    if not dataset_dir.exists():
+        return
+    move_legacy_files(dataset_dir)
+    for part in sorted(dataset_dir.glob("year=*/month=*")):
+        compact_month(part, row_group_size)
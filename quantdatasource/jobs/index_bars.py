@@ -0,0 +1,111 @@
+"""
+大盘指数K线按指数保存，每个周期(daily/week/mon)一个目录：
+    {symbol}.parquet                全部K线，按 dt 排序
+    _delta/{symbol}/*.parquet       每次更新新增的数据，攒够 merge_every 个或每周压缩(dataset_compact)时合并进 {symbol}.parquet
+    _dts.parquet                    各指数已写入的 dt(包括还没有合并的增量)，按 dt 精确去重，缺失的历史日期可以补写
+读取请用 read_index_bars，会合并还没有合并的增量数据
+"""
+
+import datetime
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from quantdatasource.api.utils import atomic_write
+
+delta_dir_name = "_delta"
+dts_name = "_dts.parquet"
+merge_every = 5
+
+
+def _load_dts(out):
+    path = out / dts_name
+    if not path.exists():
+        return {}
+    df = pd.read_parquet(path)
+    return {symbol: set(one) for symbol, one in df.groupby("symbol")["dt"]}
+
+
+def _save_dts(out, dts):
+    df = pd.DataFrame(
+        [(symbol, dt) for symbol, one in dts.items() for dt in sorted(one)],
+        columns=["symbol", "dt"],
+    )
+    with atomic_write(out / dts_name) as tmp:
+        df.to_parquet(tmp, index=False)
+
+
+def _delta_files(out, symbol):
+    """文件名是写入时间，按文件名排序，合并时后写入的数据覆盖先写入的"""
+    return sorted((out / delta_dir_name / symbol).glob("*.parquet"))
+
+
+def _read_files(files, columns=None):
+    df = pd.concat([pd.read_parquet(f, columns=columns) for f in files])
+    df = df.drop_duplicates("dt", keep="last")
+    return df.sort_values("dt", kind="stable").reset_index(drop=True)
+
+
+def append(df: pd.DataFrame, out, merge_every=merge_every):
+    """新数据按指数写入增量文件，已写入的 dt 不再写入"""
+    out = Path(out)
+    dts = _load_dts(out)
+    name = datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")
+    changed = False
+    for symbol, new in df.groupby("symbol"):
+        o = out / f"{symbol}.parquet"
+        if not o.exists():
+            logging.error(f"指数日线 {o} not found")
+            continue
+        if symbol not in dts:
+            # 第一次更新时从已有文件中读取已写入的 dt
+            dts[symbol] = set(read_index_bars(out, symbol, columns=["dt"])["dt"])
+        exists = new["dt"].isin(list(dts[symbol]))
+        for dt in new.loc[exists, "dt"]:
+            logging.warning(f"{dt} is in {o}")
+        new = new.loc[~exists].drop(columns="symbol").drop_duplicates("dt")
+        if new.empty:
+            continue
+        delta_dir = out / delta_dir_name / symbol
+        delta_dir.mkdir(parents=True, exist_ok=True)
+        with atomic_write(delta_dir / f"{name}.parquet") as tmp:
+            new.to_parquet(tmp, index=False)
+        dts[symbol].update(new["dt"])
+        changed = True
+        logging.info(f"更新[{o}] {len(new)} 行")
+        if len(_delta_files(out, symbol)) >= merge_every:
+            merge(out, symbol)
+    if changed:
+        _save_dts(out, dts)
+
+
+def merge(out, symbol):
+    """把一个指数的增量文件合并进 {symbol}.parquet"""
+    out = Path(out)
+    files = _delta_files(out, symbol)
+    if not files:
+        return
+    o = out / f"{symbol}.parquet"
+    df = _read_files([o, *files])
+    with atomic_write(o) as tmp:
+        df.to_parquet(tmp, index=False)
+    for f in files:
+        os.remove(f)
+    logging.info(f"合并[{o}] {len(files)} 个增量文件")
+
+
+def compact(out):
+    """合并目录下所有指数的增量文件"""
+    out = Path(out)
+    for delta_dir in sorted((out / delta_dir_name).glob("*")):
+        merge(out, delta_dir.name)
+
+
+def read_index_bars(out, symbol, columns=None):
+    """读取一个指数的全部K线，包括还没有合并的增量数据，按 dt 排序"""
+    out = Path(out)
+    if columns is not None:
+        columns = list(dict.fromkeys(["dt", *columns]))
+    return _read_files([out / f"{symbol}.parquet", *_delta_files(out, symbol)], columns)
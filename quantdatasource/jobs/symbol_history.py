@@ -0,0 +1,193 @@
+"""
+按 symbol 转置的历史数据：把按天保存的截面数据集(见 dataset_saver)转为按 symbol 分桶的文件，
+读取一只股票的全部历史只需要读取一个桶，history.parquet 中每个 symbol 一个 row group，是一次连续读取
+    bucket=NN/history.parquet       按 (symbol, dt) 排序的历史数据
+    bucket=NN/delta-*.parquet       每次转置新增的数据，定期合并进 history.parquet
+    state.json                      已转置到的日期和分桶数量
+"""
+
+import datetime
+import json
+import logging
+import os
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from quantdatasource.api.utils import atomic_write
+from quantdatasource.jobs import dataset_saver
+
+history_name = "history.parquet"
+state_name = "state.json"
+default_buckets = 64
+
+
+def bucket_of(symbol, buckets=default_buckets):
+    return zlib.crc32(symbol.encode()) % buckets
+
+
+def bucket_dir(history_dir, bucket):
+    return Path(history_dir, f"bucket={bucket:02d}")
+
+
+def _load_state(history_dir):
+    path = Path(history_dir, state_name)
+    if not path.exists():
+        return {"last_date": None, "buckets": default_buckets}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _save_state(history_dir, state):
+    with atomic_write(Path(history_dir, state_name)) as tmp:
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+
+
+def _write_by_symbol(df, path):
+    """按 (symbol, dt) 排序写入，每个 symbol 一个 row group"""
+    df = df.sort_values(["symbol", "dt"], kind="stable").reset_index(drop=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    symbols = df["symbol"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]])
+    ends = np.r_[starts[1:], len(df)]
+    with atomic_write(path) as tmp:
+        with pq.ParquetWriter(tmp, table.schema, compression="zstd") as writer:
+            for start, end in zip(starts, ends):
+                writer.write_table(
+                    table.slice(start, end - start), row_group_size=end - start
+                )
+
+
+def _delta_files(bdir):
+    """按写入时间排序，合并时后写入的数据覆盖先写入的"""
+    return sorted(bdir.glob("delta-*.parquet"), key=lambda f: f.stat().st_mtime_ns)
+
+
+def _write_deltas(df, history_dir, buckets):
+    first, last = df["dt"].min().date(), df["dt"].max().date()
+    mapping = {s: bucket_of(s, buckets) for s in df["symbol"].unique()}
+    for bucket, part in df.groupby(df["symbol"].map(mapping)):
+        bdir = bucket_dir(history_dir, bucket)
+        bdir.mkdir(parents=True, exist_ok=True)
+        _write_by_symbol(part, bdir / f"delta-{first}_{last}.parquet")
+    logging.info(f"转置[{history_dir}] {first}~{last} {len(df)} 行")
+
+
+def _read_files(files, filters):
+    # 直接读取文件列表，不会读到写了一半的临时文件，partitioning=None 不加入 year/month 分区字段
+    files = [str(f) for f in files]
+    if not files:
+        return None
+    df = pq.read_table(files, filters=filters, partitioning=None).to_pandas()
+    return df if not df.empty else None
+
+
+def _new_files(dataset_dir, last_date):
+    """
+    last_date 之后的数据所在的文件，按年分组 {year: [file, ...]}
+    只查找 last_date 所在月份及之后的分区：日期更新的每日文件，以及包含更新日期的 compacted.parquet
+    """
+    files = {}
+    for part in sorted(dataset_dir.glob("year=*/month=*")):
+        year, month = int(part.parent.name[5:]), int(part.name[6:])
+        if last_date is not None and (year, month) < (last_date.year, last_date.month):
+            continue
+        for f in sorted(part.glob("*.parquet")):
+            if last_date is not None:
+                if f.name == dataset_saver.compacted_name:
+                    dts = pq.read_table(f, columns=["dt"]).column("dt").to_pandas()
+                    if dts.max() <= pd.Timestamp(last_date):
+                        continue
+                elif datetime.date.fromisoformat(f.stem) <= last_date:
+                    continue
+            files.setdefault(year, []).append(f)
+    return files
+
+
+def transpose(dataset_dir, history_dir, rerun_date=None):
+    """
+    把截面数据集中上次转置之后的日期追加到按 symbol 分桶的历史数据，每年写一次 delta 文件
+    rerun_date 不晚于上次转置的日期时(重新导入了这一天的数据)，重新转置这一天
+    第一次转置(全量)完成后直接合并
+    """
+    dataset_dir = Path(dataset_dir)
+    history_dir = Path(history_dir)
+    if not dataset_dir.exists():
+        return
+    dataset_saver.move_legacy_files(dataset_dir)
+    history_dir.mkdir(parents=True, exist_ok=True)
+    state = _load_state(history_dir)
+    last_date = state["last_date"]
+    filters = None
+    if last_date is not None:
+        last_date = datetime.date.fromisoformat(last_date)
+        filters = [("dt", ">", pd.Timestamp(last_date))]
+        if rerun_date is not None and rerun_date <= last_date:
+            part = dataset_saver.partition_dir(dataset_dir, rerun_date)
+            df = _read_files(
+                part.glob("*.parquet"), [("dt", "==", pd.Timestamp(rerun_date))]
+            )
+            if df is not None:
+                _write_deltas(df, history_dir, state["buckets"])
+
+    new_last_date = last_date
+    for files in _new_files(dataset_dir, last_date).values():
+        df = _read_files(files, filters)
+        if df is None:
+            continue
+        _write_deltas(df, history_dir, state["buckets"])
+        new_last_date = df["dt"].max().date()
+        state["last_date"] = new_last_date.isoformat()
+        _save_state(history_dir, state)
+
+    if last_date is None and new_last_date is not None:
+        compact_history(history_dir)
+
+
+def compact_bucket(bdir):
+    """把桶中的 delta 文件合并进 history.parquet，相同 (symbol, dt) 保留最后写入的"""
+    files = _delta_files(bdir)
+    if not files:
+        return
+    history = bdir / history_name
+    dfs = [pd.read_parquet(f) for f in files]
+    if history.exists():
+        dfs.insert(0, pd.read_parquet(history))
+    df = pd.concat(dfs, ignore_index=True)
+    df = df.drop_duplicates(["symbol", "dt"], keep="last")
+    _write_by_symbol(df, history)
+    for f in files:
+        os.remove(f)
+
+
+def compact_history(history_dir):
+    history_dir = Path(history_dir)
+    bdirs = sorted(history_dir.glob("bucket=*"))
+    for bdir in bdirs:
+        compact_bucket(bdir)
+    logging.info(f"合并[{history_dir}] {len(bdirs)} 个桶")
+
+
+def read_symbol(history_dir, symbol, columns=None):
+    """读取一个 symbol 的全部历史，按 dt 排序"""
+    state = _load_state(history_dir)
+    bdir = bucket_dir(history_dir, bucket_of(symbol, state["buckets"]))
+    files = _delta_files(bdir)
+    if (bdir / history_name).exists():
+        files.insert(0, bdir / history_name)
+    if not files:
+        return None
+    if columns is not None:
+        columns = list(dict.fromkeys(["dt", "symbol", *columns]))
+    dfs = [
+        pd.read_parquet(f, columns=columns, filters=[("symbol", "==", symbol)])
+        for f in files
+    ]
+    df = pd.concat(dfs, ignore_index=True)
+    df = df.drop_duplicates("dt", keep="last")
+    return df.sort_values("dt", kind="stable").reset_index(drop=True)
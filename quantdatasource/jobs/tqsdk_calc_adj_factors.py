@@ -15,7 +15,13 @@ __all__ = ["tqsdk_calc_adj_factors"]
 def tqsdk_calc_adj_factors(dt, is_collect, is_import):
     from quantdatasource.api.tqsdk import TQSDKApi
 
-    api = TQSDKApi(account.tq_username, account.tq_psw, account.raw_future_output, dt)
+    api = TQSDKApi(
+        account.tq_username,
+        account.tq_psw,
+        account.raw_future_output,
+        dt,
+        raw_format=account.raw_format,
+    )
     with closing(api):
         if is_collect:
             api.full_download_future_cont_list()
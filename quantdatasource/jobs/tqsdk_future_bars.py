@@ -1,5 +1,6 @@
 import logging
 from contextlib import closing
+from pathlib import Path
 
 from quantdatasource.api.tushare import TushareFutureApi
 from quantdatasource.jobs import account
@@ -13,66 +14,121 @@ __all__ = ["tqsdk_future_bars"]
     name="[TQSDKApi|TushareFutureApi]更新期货K线数据(未测试)",
 )
 def tqsdk_future_bars(dt, is_collect, is_import):
-    tushare_api = TushareFutureApi(account.tushare_token, account.raw_future_output, dt)
-    if is_collect:
-        tushare_api.full_download_all_future_bars()
+    tushare_api = TushareFutureApi(
+        account.tushare_token,
+        account.raw_future_output,
+        dt,
+        raw_format=account.raw_format,
+    )
+    with closing(tushare_api):
+        if is_collect:
+            tushare_api.full_download_all_future_bars()
     from quantdatasource.api.tqsdk import TQSDKApi
 
-    api = TQSDKApi(account.tq_username, account.tq_psw, account.raw_future_output, dt)
+    api = TQSDKApi(
+        account.tq_username,
+        account.tq_psw,
+        account.raw_future_output,
+        dt,
+        raw_format=account.raw_format,
+    )
     with closing(api):
         if is_collect:
             api.full_download_bars()
 
     if is_import:
         from quantdatasource.dbimport import tdengine
+        from quantdatasource.dbimport.import_index import ImportIndex
         from quantdatasource.dbimport.tqsdk import klines
         from quantdatasource.dbimport.tushare import future_daily
 
-        for df, symbol, itv, exchange, is_history in klines.read_klines(
-            api.bars_history_path, api.bars_current_path
-        ):
-            tbname = tdengine.get_tbname(symbol + "_" + itv, stable="bars")
-            existed_tables = tdengine.get_existed_tables("bars")
-            if is_history and tbname in existed_tables:
-                # chech table exists. don't import if it has imported.
-                logging.info(f"{symbol} {itv} already exists.")
-                continue
-            tdengine.create_child_tables([tbname], "bars", [(symbol, itv, exchange)])
-            tdengine.insert(
-                df,
-                tbname,
-                types={
-                    "dt": "timestamp",
-                    "open": "float",
-                    "high": "float",
-                    "low": "float",
-                    "close": "float",
-                    "volume": "int unsigned",
-                    "amount": "bigint unsigned",
-                    "open_interest": "int unsigned",
-                },
+        tdengine.connect(**account.tdengine)
+        try:
+            # 子表目录每次运行只查询一次，建表删表时同步更新
+            bars_tables = tdengine.get_existed_tables("bars")
+            daily_tables = tdengine.get_existed_tables("bars_daily")
+            # 已经完整导入且没有变化的历史文件不再读取
+            index = ImportIndex(
+                Path(account.raw_future_output, "tdengine_imported.json")
             )
 
-        for df, week_df, symbol, is_history in future_daily.read_daily_and_weekly(
-            tushare_api.future_daily_history_path, tushare_api.future_daily_current_path
-        ):
-            tbname = tdengine.get_tbname(symbol, stable="bars_daily")
-            existed_tables = tdengine.get_existed_tables("bars_daily")
-            if is_history and tbname in existed_tables:
-                # chech table exists. don't import if it has imported.
-                logging.info(f"{symbol} daily already exists.")
-                continue
+            def skip(csv, is_history):
+                return is_history and index.is_imported(csv)
 
-            tdengine.drop_tables([symbol + "_" + "w"], "bars_daily")
-            tdengine.create_child_tables(
-                [
-                    tbname,
-                    tdengine.get_tbname(
-                        symbol + "_" + "w", stable="bars_daily"
-                    ),
-                ],
-                "bars_daily",
-                [(symbol, exchange), (symbol, exchange)],
-            )
-            tdengine.insert(df, symbol, stable="bars_daily")
-            tdengine.insert(week_df, symbol + "_" + "w", stable="bars_daily")
+            with closing(index):
+                # 多进程读取转换K线文件，按完成顺序写入
+                for (
+                    csv,
+                    is_history,
+                    symbol,
+                    exchange,
+                    results,
+                ) in klines.full_read_klines(
+                    api.bars_history_path,
+                    api.bars_current_path,
+                    api.future_basic_path,
+                    account.import_processes,
+                    skip=skip,
+                ):
+                    imports = []
+                    for df, itv in results:
+                        tbname = tdengine.get_tbname(symbol + "_" + itv, stable="bars")
+                        if is_history and tbname in bars_tables:
+                            # chech table exists. don't import if it has imported.
+                            logging.info(f"{symbol} {itv} already exists.")
+                            continue
+                        imports.append((df, itv, tbname))
+                    # 一个文件的全部周期一次建表
+                    tdengine.create_child_tables(
+                        [tbname for _, _, tbname in imports],
+                        "bars",
+                        [(symbol, itv, exchange) for _, itv, _ in imports],
+                    )
+                    for df, itv, tbname in imports:
+                        tdengine.insert(
+                            df,
+                            tbname,
+                            types={
+                                "dt": "timestamp",
+                                "open": "float",
+                                "high": "float",
+                                "low": "float",
+                                "close": "float",
+                                "volume": "int unsigned",
+                                "amount": "bigint unsigned",
+                                "open_interest": "int unsigned",
+                            },
+                        )
+                    if is_history:
+                        index.record(csv)
+
+                daily = future_daily.read_daily_and_weekly(
+                    tushare_api.future_daily_history_path,
+                    tushare_api.future_daily_current_path,
+                    skip=skip,
+                )
+                for df, week_df, symbol, exchange, is_history, csv in daily:
+                    tbname = tdengine.get_tbname(symbol, stable="bars_daily")
+                    if is_history and tbname in daily_tables:
+                        # chech table exists. don't import if it has imported.
+                        logging.info(f"{symbol} daily already exists.")
+                        index.record(csv)
+                        continue
+
+                    tdengine.drop_tables([symbol + "_" + "w"], "bars_daily")
+                    tdengine.create_child_tables(
+                        [
+                            tbname,
+                            tdengine.get_tbname(
+                                symbol + "_" + "w", stable="bars_daily"
+                            ),
+                        ],
+                        "bars_daily",
+                        [(symbol, exchange), (symbol, exchange)],
+                    )
+                    tdengine.insert(df, symbol, stable="bars_daily")
+                    tdengine.insert(week_df, symbol + "_" + "w", stable="bars_daily")
+                    if is_history:
+                        index.record(csv)
+        finally:
+            tdengine.close()
@@ -22,7 +22,13 @@ def tqsdk_future_basic(dt, is_collect, is_import):
         return
     from quantdatasource.api.tqsdk import TQSDKApi
 
-    api = TQSDKApi(account.tq_username, account.tq_psw, account.raw_future_output, dt)
+    api = TQSDKApi(
+        account.tq_username,
+        account.tq_psw,
+        account.raw_future_output,
+        dt,
+        raw_format=account.raw_format,
+    )
     with closing(api):
         if is_collect:
             api.full_download_future_basic()
@@ -1,4 +1,5 @@
 import logging
+from contextlib import closing
 
 import pandas as pd
 from quantdata import mongo_get_data
@@ -21,25 +22,34 @@ __all__ = ["tushare_cb_data"]
     misfire_grace_time=200,
 )
 def tushare_cb_data(dt, is_collect, is_import):
-    api = TushareApi(account.tushare_token, account.raw_astock_output, dt)
-    if is_collect:
-        api.full_download_cb_share_data(include_delist_cbs=False, force_replace=True)
-        api.full_download_cb_call_data(include_delist_cbs=False, force_replace=True)
-
-    if is_import:
-        from quantdatasource.dbimport.tushare import cb
-
-        dfs = []
-        for cb_info in mongo_get_data("finance", "basic_info_cbs"):
-            symbol = cb_info["ts_code"]
-            call_df = cb.read_cb_call(symbol, api.cb_call_path)
-            share_df = cb.read_cb_share(cb_info, api.cb_share_path)
-            df = pd.merge_ordered(call_df, share_df, on="dt", how="outer")
-            if not df.empty:
-                df["symbol"] = symbol
-                dfs.append(df)
-
-        big_df = pd.concat(dfs)
-        file_path = f"{account.astock_output}/cb_data.parquet"
-        big_df.to_parquet(file_path, index=False)
-        logging.info(f"写入[{file_path}]")
+    api = TushareApi(
+        account.tushare_token,
+        account.raw_astock_output,
+        dt,
+        rate_limits=account.tushare_rate_limits,
+        workers=account.tushare_workers,
+        raw_format=account.raw_format,
+    )
+    with closing(api):
+        if is_collect:
+            api.full_download_cb_share_and_call_data(
+                include_delist_cbs=False, force_replace=True
+            )
+
+        if is_import:
+            from quantdatasource.dbimport.tushare import cb
+
+            dfs = []
+            for cb_info in mongo_get_data("finance", "basic_info_cbs"):
+                symbol = cb_info["ts_code"]
+                call_df = cb.read_cb_call(symbol, api.cb_call_path)
+                share_df = cb.read_cb_share(cb_info, api.cb_share_path)
+                df = pd.merge_ordered(call_df, share_df, on="dt", how="outer")
+                if not df.empty:
+                    df["symbol"] = symbol
+                    dfs.append(df)
+
+            big_df = pd.concat(dfs)
+            file_path = f"{account.astock_output}/cb_data.parquet"
+            big_df.to_parquet(file_path, index=False)
+            logging.info(f"写入[{file_path}]")
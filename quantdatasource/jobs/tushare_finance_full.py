@@ -0,0 +1,46 @@
+from contextlib import closing
+
+from quantdatasource.api.tushare import TushareApi
+from quantdatasource.jobs import account, data_saver
+from quantdatasource.jobs.scheduler import job
+
+__all__ = ["tushare_finance_full"]
+
+
+# 手动执行：全量重建 finance 库中的三大报表
+@job(
+    id="astock_tushare_finance_full",
+    name="[TushareApi]三大报表全量导入",
+)
+def tushare_finance_full(dt, is_collect, is_import):
+    api = TushareApi(
+        account.tushare_token,
+        account.raw_astock_output,
+        dt,
+        rate_limits=account.tushare_rate_limits,
+        workers=account.tushare_workers,
+        raw_format=account.raw_format,
+    )
+    with closing(api):
+        if is_collect:
+            api.full_download_finance_data()
+
+        if is_import:
+            from quantdatasource.dbimport.tushare import finance
+
+            # 多进程解析财报文件，单个线程批量写入临时集合，全部完成后替换原集合
+            with data_saver.MongoBulkWriter(
+                "finance", replace=True, ignore_nan=True
+            ) as writer:
+                for report_type, finance_path in [
+                    ("balancesheet", api.finance_balancesheet_path),
+                    ("income", api.finance_income_path),
+                    ("cashflow", api.finance_cashflow_path),
+                ]:
+                    tablename = f"finance_{report_type}"
+                    for df, df_q, _ in finance.full_read_finance_data(
+                        finance_path, report_type, account.import_processes
+                    ):
+                        writer.put(tablename, df)
+                        if df_q is not None:
+                            writer.put(f"{tablename}_q", df_q)
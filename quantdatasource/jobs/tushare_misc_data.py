@@ -1,10 +1,12 @@
 import logging
 import pathlib
+from contextlib import closing
 
 import pandas as pd
+from pymongo import UpdateOne
 
 from quantdatasource.api.tushare import TushareApi
-from quantdatasource.jobs import account, data_saver
+from quantdatasource.jobs import account, data_saver, dataset_saver
 from quantdatasource.jobs.calendar import get_astock_calendar
 from quantdatasource.jobs.scheduler import job
 
@@ -47,62 +49,103 @@ def _finance_diff(data1, data2):
     return ret
 
 
-def _mongo_import_finance_data(row, symbol, tablename):
+def _finance_key(row):
+    return row["ts_code"], row["f_ann_date"], row["end_date"]
+
+
+def _upsert_finance_docs(table, docs):
+    if not docs:
+        return None
+    return table.bulk_write(
+        [
+            UpdateOne(
+                {"ts_code": key[0], "f_ann_date": key[1], "end_date": key[2]},
+                {"$set": doc},
+                upsert=True,
+            )
+            for key, doc in docs.items()
+        ],
+        ordered=False,
+    )
+
+
+def _load_last_docs(table, rows):
+    """
+    一次查询出所有需要的上一期财报，按 (ts_code, end_date) 保留最新发布的一期
+    """
+    pairs = set()
+    for row in rows:
+        last_end_date = _find_last_end_date(row["end_date"])
+        if last_end_date is not None:
+            pairs.add((row["ts_code"], last_end_date))
+    if not pairs:
+        return {}
+    last_docs = {}
+    for doc in table.find(
+        {
+            "ts_code": {"$in": list({symbol for symbol, _ in pairs})},
+            "end_date": {"$in": list({end_date for _, end_date in pairs})},
+        }
+    ):
+        key = (doc["ts_code"], doc["end_date"])
+        if key not in pairs:
+            continue
+        if key not in last_docs or doc["f_ann_date"] > last_docs[key]["f_ann_date"]:
+            last_docs[key] = doc
+    return last_docs
+
+
+def _mongo_import_finance_data(rows, tablename):
+    """
+    批量导入财报：累计报表和单季报表各一次 bulk_write，上一期财报一次查询预先读取
+    rows 按读取顺序处理，和逐条导入的结果一致
+    """
+    if not rows:
+        return
     conn = data_saver.get_conn_mongodb()
     table = conn["finance"][tablename]
-    end_date = row["end_date"]
-    update_result = table.update_one(
-        {
-            "ts_code": symbol,
-            "f_ann_date": row["f_ann_date"],
-            "end_date": end_date,
-        },
-        {"$set": row},
-        upsert=True,
-    )
+    is_balancesheet = tablename == "finance_balancesheet"
+    last_docs = {} if is_balancesheet else _load_last_docs(table, rows)
 
-    if update_result.upserted_id is not None:
-        logging.info(f"导入 {tablename} {symbol} {end_date} 财报数据完成")
-    elif update_result.modified_count > 0:
-        logging.info(f"替换 {tablename} {symbol} {end_date} 财报数据完成")
+    # 同一个 (ts_code, f_ann_date, end_date) 可能出现多次，按顺序合并，和依次 $set 的结果相同
+    docs = {}
+    docs_q = {}
+    q1_count = 0
+    for row in rows:
+        key = _finance_key(row)
+        docs.setdefault(key, {}).update(row)
+        if is_balancesheet:
+            continue
+        symbol, f_ann_date, end_date = key
+        # 本批次中已经导入的财报也可以作为后面财报的上一期
+        latest = last_docs.get((symbol, end_date))
+        if latest is None or f_ann_date >= latest["f_ann_date"]:
+            if latest is not None and f_ann_date == latest["f_ann_date"]:
+                latest = {**latest, **row}
+            else:
+                latest = dict(row)
+            last_docs[(symbol, end_date)] = latest
 
-    if tablename != "finance_balancesheet":
-        quart_table = conn["finance"][tablename + "_q"]
         last_end_date = _find_last_end_date(end_date)
         if last_end_date is None:
             # 1季报直接导入单季报
-            quart_table.update_one(
-                {
-                    "ts_code": symbol,
-                    "f_ann_date": row["f_ann_date"],
-                    "end_date": end_date,
-                },
-                {"$set": row},
-                upsert=True,
-            )
-            logging.info(f"直接导入一季报 {tablename}_q {symbol} {end_date} 完成")
-        else:
-            # 找到最新的一期财报
-            p_last_doc = (
-                table.find({"ts_code": symbol, "end_date": last_end_date})
-                .sort([("f_ann_date", -1)])
-                .limit(1)
-            )  # 降序
-            try:
-                last_doc = p_last_doc.next()
-                doc_q = _finance_diff(row, last_doc)
-                quart_table.update_one(
-                    {
-                        "ts_code": symbol,
-                        "f_ann_date": row["f_ann_date"],
-                        "end_date": end_date,
-                    },
-                    {"$set": doc_q},
-                    upsert=True,
-                )
-                logging.info(f"导入单季报 {tablename}_q {symbol} {end_date} 完成")
-            except:
-                pass
+            docs_q.setdefault(key, {}).update(row)
+            q1_count += 1
+            continue
+        last_doc = last_docs.get((symbol, last_end_date))
+        if last_doc is None:
+            continue
+        docs_q.setdefault(key, {}).update(_finance_diff(row, last_doc))
+
+    result = _upsert_finance_docs(table, docs)
+    logging.info(
+        f"导入 {tablename} 财报数据 {len(docs)} 条：新增 {result.upserted_count}，替换 {result.modified_count}"
+    )
+    if not is_balancesheet:
+        _upsert_finance_docs(conn["finance"][tablename + "_q"], docs_q)
+        logging.info(
+            f"导入单季报 {tablename}_q {len(docs_q)} 条完成，其中一季报 {q1_count} 条"
+        )
 
 
 @job(
@@ -115,108 +158,125 @@ def _mongo_import_finance_data(row, symbol, tablename):
     misfire_grace_time=200,
 )
 def tushare_misc_data(dt, is_collect, is_import):
-    api = TushareApi(account.tushare_token, account.raw_astock_output, dt)
-    if is_collect:
-        api.addition_download_finance_data()
-
-    if is_import:
-        from quantdatasource.dbimport.tushare import finance
-
-        for row, symbol in finance.addition_read_finance_data(
-            dt, api.finance_income_addition_path
-        ):
-            _mongo_import_finance_data(row, symbol, "finance_income")
-
-        for row, symbol in finance.addition_read_finance_data(
-            dt, api.finance_balancesheet_addition_path
-        ):
-            _mongo_import_finance_data(row, symbol, "finance_balancesheet")
-
-        for row, symbol in finance.addition_read_finance_data(
-            dt, api.finance_cashflow_addition_path
-        ):
-            _mongo_import_finance_data(row, symbol, "finance_cashflow")
-
-    calendar = get_astock_calendar()
-    if not calendar.is_trading_day(dt):
-        return
+    api = TushareApi(
+        account.tushare_token,
+        account.raw_astock_output,
+        dt,
+        rate_limits=account.tushare_rate_limits,
+        workers=account.tushare_workers,
+        raw_format=account.raw_format,
+    )
+    with closing(api):
+        if is_collect:
+            api.addition_download_finance_data()
+
+        if is_import:
+            from quantdatasource.dbimport.tushare import finance
+
+            rows = [
+                row
+                for row, _ in finance.addition_read_finance_data(
+                    dt, api.finance_income_addition_path
+                )
+            ]
+            _mongo_import_finance_data(rows, "finance_income")
 
-    if is_collect:
-        api.full_download_stock_basic()
-        api.full_download_cb_basic()
-        api.full_download_ths_index()
-        api.full_download_concepts_members(force_replace=True)
+            rows = [
+                row
+                for row, _ in finance.addition_read_finance_data(
+                    dt, api.finance_balancesheet_addition_path
+                )
+            ]
+            _mongo_import_finance_data(rows, "finance_balancesheet")
 
-        api.addition_download_concepts_bars()
-        api.addition_download_daily()
-        api.addition_download_daily_basic()
-        api.addition_download_moneyflow()
-        api.addition_download_lhb()
+            rows = [
+                row
+                for row, _ in finance.addition_read_finance_data(
+                    dt, api.finance_cashflow_addition_path
+                )
+            ]
+            _mongo_import_finance_data(rows, "finance_cashflow")
 
-    if is_import:
-        from quantdatasource.dbimport.tushare import cb, lhb, stock, ths_index
+        calendar = get_astock_calendar()
+        if not calendar.is_trading_day(dt):
+            return
 
-        output_dir = pathlib.Path(account.astock_output)
-        stock_basic_df = stock.read_basic(api.basic_stock_path)
-        data_saver.mongo_insert_many(stock_basic_df, "finance", "basic_info_stocks")
+        if is_collect:
+            api.full_download_stock_basic()
+            api.full_download_cb_basic()
+            api.full_download_ths_index()
+            api.full_download_concepts_members(force_replace=True)
 
-        concepts_basic_df = ths_index.read_ths_concepts_basic(
-            api.ths_index_a_concepts_path
-        )
-        data_saver.mongo_insert_many(
-            concepts_basic_df,
-            "finance",
-            "basic_info_ths_concepts",
-        )
-        conn = data_saver.get_conn_mongodb()
-        all_ths_index_df = pd.DataFrame(conn["finance"]["constituent_ths_index"].find())
-        addition_constituent_rows = ths_index.addition_read_ths_concepts_constituent(
-            dt, all_ths_index_df, api.ths_concepts_members_path
-        )
-        if addition_constituent_rows:
-            conn["finance"]["constituent_ths_index"].insert_many(
-                addition_constituent_rows
+            api.addition_download_concepts_bars()
+            api.addition_download_daily()
+            api.addition_download_daily_basic()
+            api.addition_download_moneyflow()
+            api.addition_download_lhb()
+
+        if is_import:
+            from quantdatasource.dbimport.tushare import cb, lhb, stock, ths_index
+
+            output_dir = pathlib.Path(account.astock_output)
+            stock_basic_df = stock.read_basic(api.basic_stock_path)
+            data_saver.mongo_insert_many(stock_basic_df, "finance", "basic_info_stocks")
+
+            concepts_basic_df = ths_index.read_ths_concepts_basic(
+                api.ths_index_a_concepts_path
             )
-        else:
-            logging.info("同花顺概念股成分没有增量改变")
+            data_saver.mongo_insert_many(
+                concepts_basic_df,
+                "finance",
+                "basic_info_ths_concepts",
+            )
+            conn = data_saver.get_conn_mongodb()
+            all_ths_index_df = pd.DataFrame(
+                conn["finance"]["constituent_ths_index"].find()
+            )
+            addition_constituent_rows = (
+                ths_index.addition_read_ths_concepts_constituent(
+                    dt, all_ths_index_df, api.ths_concepts_members_path
+                )
+            )
+            if addition_constituent_rows:
+                conn["finance"]["constituent_ths_index"].insert_many(
+                    addition_constituent_rows
+                )
+            else:
+                logging.info("同花顺概念股成分没有增量改变")
 
-        ths_index_daily_out = output_dir / "bars_ths_index_daily"
-        ths_index_daily_out.mkdir(parents=True, exist_ok=True)
-        ths_index_df = ths_index.addition_read_concepts_bars(
-            api.ths_daily_bars_addition_path, concepts_basic_df
-        )
-        ths_index_file_path = ths_index_daily_out / f"{dt.date().isoformat()}.parquet"
-        ths_index_df.to_parquet(ths_index_file_path, index=False)
-        logging.info(f"写入[{ths_index_file_path}]")
-
-        chinese_names = dict(zip(stock_basic_df["symbol"], stock_basic_df["name"]))
-        daily_bars = stock.addition_read_stock_daily_bars(
-            dt,
-            api.daily_bars_addition_path,
-            api.daily_basic_addition_path,
-            api.moneyflow_addition_path,
-            chinese_names,
-        )
-        stock_daily_out = output_dir / "daily_factors"
-        stock_daily_out.mkdir(parents=True, exist_ok=True)
-        stock_daily_file_path = stock_daily_out / f"{dt.date().isoformat()}.parquet"
-        daily_bars.to_parquet(stock_daily_file_path)
-        logging.info(f"写入[{stock_daily_file_path}]")
-
-        lhb_collection = conn["finance"]["lhb"]
-        lhb_data = lhb.addition_read_lhb(
-            api.lhb_addition_path, api.lhb_inst_addition_path
-        )
-        if lhb_data:
-            lhb_collection.insert_many(lhb_data)
-            logging.info(f"写入MongoDB[finance][lhb]")
-        else:
-            logging.error(f"写入MongoDB[finance][lhb]为空")
-
-        cb_basic_df = cb.read_basic(api.basic_cb_path)
-        data_saver.mongo_insert_many(
-            cb_basic_df,
-            "finance",
-            "basic_info_cbs",
-            ignore_nan=True,
-        )
+            ths_index_df = ths_index.addition_read_concepts_bars(
+                api.ths_daily_bars_addition_path, concepts_basic_df
+            )
+            dataset_saver.append_day(
+                ths_index_df, output_dir / "bars_ths_index_daily", dt.date()
+            )
+
+            chinese_names = dict(zip(stock_basic_df["symbol"], stock_basic_df["name"]))
+            daily_bars = stock.addition_read_stock_daily_bars(
+                dt,
+                api.daily_bars_addition_path,
+                api.daily_basic_addition_path,
+                api.moneyflow_addition_path,
+                chinese_names,
+            )
+            dataset_saver.append_day(
+                daily_bars, output_dir / "daily_factors", dt.date()
+            )
+
+            lhb_collection = conn["finance"]["lhb"]
+            lhb_data = lhb.addition_read_lhb(
+                api.lhb_addition_path, api.lhb_inst_addition_path
+            )
+            if lhb_data:
+                lhb_collection.insert_many(lhb_data)
+                logging.info(f"写入MongoDB[finance][lhb]")
+            else:
+                logging.error(f"写入MongoDB[finance][lhb]为空")
+
+            cb_basic_df = cb.read_basic(api.basic_cb_path)
+            data_saver.mongo_insert_many(
+                cb_basic_df,
+                "finance",
+                "basic_info_cbs",
+                ignore_nan=True,
+            )